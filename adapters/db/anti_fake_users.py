@@ -1,28 +1,73 @@
+from typing import NamedTuple
+
 from adapters.db.models import ChannelWhiteList
+from helpers.singleflight import single_flight
+
+# fullname 是规范化之后的频道名称，raw_fullname 是频道名称原样
+DEFAULT_LINKED_INFO = {"id": None, "fullname": None, "username": None, "raw_fullname": None}
+
 
-async def get_whitelist(chat_id: int) -> dict:
+class ChannelWhiteListSnapshot(NamedTuple):
+    """Cached copy of a chat's ChannelWhiteList row."""
+    whitelist: frozenset[int]
+    also_ban: bool
+    linked_info: dict
+
+# chat_id -> 群组的白名单快照，写入时失效
+_snapshots: dict[int, ChannelWhiteListSnapshot] = {}
+# 每个群组的快照失效次数，用于丢弃失效前开始的查询结果
+_snapshot_versions: dict[int, int] = {}
+
+@single_flight()
+async def _fetch_snapshot(chat_id: int) -> ChannelWhiteListSnapshot:
+    data = await ChannelWhiteList.get_or_none(chat_id=chat_id).values()
+    if not data:
+        return ChannelWhiteListSnapshot(frozenset(), False, dict(DEFAULT_LINKED_INFO))
+    return ChannelWhiteListSnapshot(
+        frozenset(data['whitelist'] or ()),
+        bool(data['also_ban']),
+        data['linked_info'] or dict(DEFAULT_LINKED_INFO),
+    )
+
+def _invalidate_snapshot(chat_id: int) -> None:
+    _snapshots.pop(chat_id, None)
+    _snapshot_versions[chat_id] = _snapshot_versions.get(chat_id, 0) + 1
+    _fetch_snapshot.forget(chat_id)
+
+async def get_whitelist_snapshot(chat_id: int) -> ChannelWhiteListSnapshot:
+    """Retrieve the whitelist, ban config and linked channel of a chat_id in one cached lookup."""
+    snapshot = _snapshots.get(chat_id)
+    if snapshot is None:
+        version = _snapshot_versions.get(chat_id, 0)
+        snapshot = await _fetch_snapshot(chat_id)
+        # 查询期间被修改时结果已经过时，不写入缓存
+        if version == _snapshot_versions.get(chat_id, 0):
+            _snapshots[chat_id] = snapshot
+    return snapshot
+
+async def get_whitelist(chat_id: int) -> frozenset[int]:
     """Retrieve whitelist for a specific chat_id."""
-    whitelist = await ChannelWhiteList.get_or_none(chat_id=chat_id).values()
-    return whitelist['whitelist'] if whitelist else []
+    return (await get_whitelist_snapshot(chat_id)).whitelist
 
 async def get_linked_channel_info(chat_id: int) -> dict:
     """Retrieve linked channel information for a specific chat_id."""
-    data = await ChannelWhiteList.get_or_none(chat_id=chat_id).values()
-    if data:
-        return data['linked_info']
-    return {"id": None, "fullname": None, "username": None}
+    return (await get_whitelist_snapshot(chat_id)).linked_info
 
 async def add_whitelist(chat_id: int, channel: int) -> None:
     """Update whitelist for a specific chat_id."""
     data, created = await ChannelWhiteList.get_or_create(chat_id=chat_id)
     data.whitelist.append(channel)
     await data.save()
+    _invalidate_snapshot(chat_id)
 
-async def update_linked_channel_info(chat_id: int, linked_id: int, linked_fullname: str, linked_username: str) -> None:
+async def update_linked_channel_info(chat_id: int, linked_id: int, linked_fullname: str, linked_username: str,
+                                     linked_raw_fullname: str | None = None) -> None:
     """Update linked channel information for a specific chat_id."""
     data, created = await ChannelWhiteList.get_or_create(chat_id=chat_id)
-    data.linked_info = {"id":linked_id, "fullname":linked_fullname, "username":linked_username}
+    data.linked_info = {"id":linked_id, "fullname":linked_fullname, "username":linked_username,
+                        "raw_fullname":linked_raw_fullname}
     await data.save()
+    _invalidate_snapshot(chat_id)
 
 async def remove_whitelist(chat_id: int, channel: int) -> None:
     """Remove a channel from whitelist for a specific chat_id."""
@@ -30,14 +75,15 @@ async def remove_whitelist(chat_id: int, channel: int) -> None:
     if data and channel in data.whitelist:
         data.whitelist.remove(channel)
         await data.save()
+        _invalidate_snapshot(chat_id)
 
-async def get_ban_config(chat_id: int) -> dict:
+async def get_ban_config(chat_id: int) -> bool:
     """Retrieve ban configuration for a specific chat_id."""
-    config = await ChannelWhiteList.get_or_none(chat_id=chat_id).values()
-    return config['also_ban'] if config else False
+    return (await get_whitelist_snapshot(chat_id)).also_ban
 
 async def set_ban_config(chat_id: int, also_ban: bool) -> None:
     """Set ban configuration for a specific chat_id."""
     data, created = await ChannelWhiteList.get_or_create(chat_id=chat_id)
     data.also_ban = also_ban
-    await data.save()
\ No newline at end of file
+    await data.save()
+    _invalidate_snapshot(chat_id)
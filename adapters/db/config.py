@@ -1,16 +1,54 @@
+from typing import Callable
+
+from tortoise import fields
+
 from adapters.db.models import Config
 from adapters.db.models import ChannelWhiteList
+from helpers.singleflight import single_flight
+
+# chat_id -> 数据库中的配置行，没有配置的群组缓存为 None
+_config_cache: dict[int, dict | None] = {}
+# 每个群组配置被修改的次数，用于丢弃修改前开始的查询结果
+_config_versions: dict[int, int] = {}
+# 群组配置变化时需要通知的回调，参数为 chat_id
+_invalidation_listeners: list[Callable[[int], None]] = []
+
+def is_boolean_feature(feature: str) -> bool:
+    """Whether a feature is stored as a plain on/off flag in the database."""
+    return isinstance(Config._meta.fields_map.get(feature), fields.BooleanField)
+
+def add_invalidation_listener(listener: Callable[[int], None]) -> None:
+    """Register a callback that is called with the chat_id whenever its config changes."""
+    _invalidation_listeners.append(listener)
+
+def invalidate_config(chat_id: int) -> None:
+    """Drop the cached config of a chat_id and notify the listeners."""
+    _config_cache.pop(chat_id, None)
+    _config_versions[chat_id] = _config_versions.get(chat_id, 0) + 1
+    _fetch_config.forget(chat_id)
+    for listener in _invalidation_listeners:
+        listener(chat_id)
+
+@single_flight()
+async def _fetch_config(chat_id: int) -> dict | None:
+    return await Config.get_or_none(chat_id=chat_id).values()
 
-async def get_config(chat_id: int) -> dict:
+async def get_config(chat_id: int) -> dict | None:
     """Retrieve configuration for a specific chat_id."""
-    config = await Config.get_or_none(chat_id=chat_id).values()
-    return config
+    if chat_id not in _config_cache:
+        version = _config_versions.get(chat_id, 0)
+        config = await _fetch_config(chat_id)
+        # 查询期间配置被修改时结果已经过时，不写入缓存
+        if version == _config_versions.get(chat_id, 0):
+            _config_cache[chat_id] = config
+        return config
+    return _config_cache[chat_id]
 
 async def get_config_value(chat_id: int, key: str) -> bool | dict | None:
     """Retrieve a specific configuration value for a chat_id."""
-    config = await Config.get_or_none(chat_id=chat_id)
+    config = await get_config(chat_id)
     if config:
-        return getattr(config, key, None)
+        return config.get(key)
     return None
 
 async def update_config_value(chat_id: int, feature: str, key: str | None, value: bool | str) -> None:
@@ -19,6 +57,7 @@ async def update_config_value(chat_id: int, feature: str, key: str | None, value
     if not key and isinstance(value, bool):
         setattr(config, feature, value)
         await config.save()
+        invalidate_config(chat_id)
         return
     elif key and isinstance(value, (bool, str)):
         feature_config = getattr(config, feature) or {}
@@ -26,4 +65,5 @@ async def update_config_value(chat_id: int, feature: str, key: str | None, value
             feature_config[key] = value
             setattr(config, feature, feature_config)
             await config.save()
-            return
\ No newline at end of file
+            invalidate_config(chat_id)
+            return
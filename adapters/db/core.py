@@ -1,16 +1,60 @@
 import os
+from typing import Any
 
 from tortoise import Tortoise
+from tortoise.backends.base.config_generator import expand_db_url
 
-async def init_db():
-    db_path = "db.sqlite3"
-    if os.getenv("DB_FILE"):
-        db_path = os.getenv("DB_FILE")
-    await Tortoise.init(
-        db_url=f'sqlite://{db_path}',
-        modules={'models': ['adapters.db.models']}
-    )
-    await Tortoise.generate_schemas()
+# SQLite 默认参数：WAL 模式下读写互不阻塞，synchronous=NORMAL 时只在检查点 fsync
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # 负数表示以 KiB 为单位，即 64 MiB 页缓存
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+}
+
+def build_db_config(settings: dict[str, Any] | None = None, sqlite_path: str | None = None) -> dict[str, Any]:
+    """
+    Build the Tortoise config from the `database` section of config.yaml.
+
+    A full database URL can be given with the DB_URL environment variable or
+    `database.url`, otherwise SQLite is used with the pragmas in SQLITE_PRAGMAS
+    overridden by `database.sqlite`.
+    """
+    settings = settings or {}
+    db_url = os.getenv("DB_URL") or settings.get('url')
+    if db_url:
+        connection = expand_db_url(db_url)
+        # 连接池大小只对 PostgreSQL/MySQL 这类有连接池的后端生效，URL 中的参数优先
+        pool = settings.get('pool') or {}
+        for key in ('minsize', 'maxsize'):
+            if pool.get(key) is not None:
+                connection['credentials'].setdefault(key, int(pool[key]))
+    else:
+        db_path = sqlite_path or os.getenv("DB_FILE") or "db.sqlite3"
+        pragmas = {**SQLITE_PRAGMAS, **(settings.get('sqlite') or {})}
+        connection = {
+            'engine': 'tortoise.backends.sqlite',
+            'credentials': {'file_path': str(db_path), **pragmas},
+        }
+    return {
+        'connections': {'default': connection},
+        'apps': {'models': {'models': ['adapters.db.models'], 'default_connection': 'default'}},
+    }
+
+async def init_db(settings: dict[str, Any] | None = None, sqlite_path: str | None = None,
+                  auto_migrate: bool | None = None):
+    """
+    Connect to the database and check its schema.
+
+    auto_migrate defaults to `database.auto_migrate`, see adapters.db.migrations.
+    """
+    from adapters.db.migrations import ensure_schema
+    await Tortoise.init(config=build_db_config(settings, sqlite_path))
+    if auto_migrate is None:
+        auto_migrate = bool((settings or {}).get('auto_migrate', False))
+    await ensure_schema(auto_migrate)
 
 async def close_db():
-    await Tortoise.close_connections()
\ No newline at end of file
+    await Tortoise.close_connections()
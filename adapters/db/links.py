@@ -0,0 +1,77 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
+from tortoise.exceptions import BaseORMException
+
+from adapters.db.models import LinkExpansion
+
+MEMORY_CACHE_SIZE = 4096
+# 每写入多少次清理一次数据库中过期的记录
+PURGE_EVERY = 500
+
+# url -> (展开后的链接，None 表示没有跳转；过期时间)，按最近使用的顺序排列
+_memory_cache: OrderedDict[str, tuple[str | None, float]] = OrderedDict()
+_writes_since_purge = 0
+
+def _key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+def _remember(url: str, expanded_url: str | None, expires_at: float) -> None:
+    _memory_cache[url] = (expanded_url, expires_at)
+    _memory_cache.move_to_end(url)
+    while len(_memory_cache) > MEMORY_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+
+async def get_cached_expansion(url: str) -> str | None:
+    """
+    Return the cached expansion of url, url itself if it's cached as not
+    redirecting, or None if nothing valid is cached.
+    """
+    now = time.time()
+    entry = _memory_cache.get(url)
+    if entry is None:
+        try:
+            row = await LinkExpansion.get_or_none(key=_key(url)).values('url', 'expanded_url', 'expires_at')
+        except BaseORMException as e:
+            logging.debug(f"读取短链接缓存失败: {e}")
+            return None
+        # 哈希相同但链接不同的情况几乎不可能发生，不过还是检查一下
+        if row is None or row['url'] != url:
+            return None
+        entry = (row['expanded_url'], row['expires_at'])
+        _remember(url, *entry)
+    else:
+        _memory_cache.move_to_end(url)
+    expanded_url, expires_at = entry
+    if expires_at <= now:
+        _memory_cache.pop(url, None)
+        try:
+            # 带上过期时间作为条件，避免删掉其他进程刚刚写入的新结果
+            await LinkExpansion.filter(key=_key(url), expires_at__lte=now).delete()
+        except BaseORMException as e:
+            logging.debug(f"删除过期的短链接缓存失败: {e}")
+        return None
+    return expanded_url or url
+
+async def save_expansion(url: str, expanded_url: str, ttl: float) -> None:
+    """Cache the expansion of url for ttl seconds, an expansion equal to url is cached as not redirecting."""
+    global _writes_since_purge
+    stored_url = None if expanded_url == url else expanded_url
+    expires_at = time.time() + ttl
+    _remember(url, stored_url, expires_at)
+    try:
+        await LinkExpansion.update_or_create(
+            key=_key(url), defaults={'url': url, 'expanded_url': stored_url, 'expires_at': expires_at}
+        )
+        _writes_since_purge += 1
+        if _writes_since_purge >= PURGE_EVERY:
+            _writes_since_purge = 0
+            await purge_expired_expansions()
+    except BaseORMException as e:
+        logging.debug(f"写入短链接缓存失败: {e}")
+
+async def purge_expired_expansions() -> int:
+    """Delete expired expansions from the database and return how many were deleted."""
+    return await LinkExpansion.filter(expires_at__lte=time.time()).delete()
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from tortoise import connections
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.exceptions import OperationalError
+
+from adapters.db.models import Config, SchemaVersion
+
+
+class SchemaOutdatedError(RuntimeError):
+    """Raised at startup when the database schema doesn't match the code."""
+
+
+# DDL 中随数据库类型变化的部分，与 Tortoise 为对应字段生成的类型一致
+DIALECT_TYPES = {
+    'sqlite': {
+        'pk': 'INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL',
+        'bool': 'INT', 'false': '0', 'json': 'JSON', 'timestamp': 'TIMESTAMP', 'float': 'REAL',
+    },
+    'postgres': {
+        'pk': 'SERIAL NOT NULL PRIMARY KEY',
+        'bool': 'BOOL', 'false': 'FALSE', 'json': 'JSONB', 'timestamp': 'TIMESTAMPTZ', 'float': 'DOUBLE PRECISION',
+    },
+}
+
+
+async def _add_rolled_count(conn: BaseDBAsyncClient) -> None:
+    """Add chat_activity_buckets.rolled_count, counting the rolled-up buckets as fully rolled up."""
+    if conn.capabilities.dialect == 'sqlite':
+        # SQLite 不支持 ADD COLUMN IF NOT EXISTS
+        _, columns = await conn.execute_query('PRAGMA table_info("chat_activity_buckets")')
+        if not any(column['name'] == 'rolled_count' for column in columns):
+            await conn.execute_script('ALTER TABLE "chat_activity_buckets" ADD COLUMN "rolled_count" INT NOT NULL DEFAULT 0')
+    else:
+        await conn.execute_script('ALTER TABLE "chat_activity_buckets" ADD COLUMN IF NOT EXISTS "rolled_count" INT NOT NULL DEFAULT 0')
+    await conn.execute_script(
+        'UPDATE "chat_activity_buckets" SET "rolled_count" = "message_count" WHERE "rolled_up" AND "rolled_count" = 0'
+    )
+
+
+def _execute(ddl: str) -> Callable[[BaseDBAsyncClient], Awaitable[None]]:
+    """Build a step running ddl, with {pk}, {bool} and the other DIALECT_TYPES placeholders filled in."""
+    async def step(conn: BaseDBAsyncClient) -> None:
+        dialect = conn.capabilities.dialect
+        if dialect not in DIALECT_TYPES:
+            raise SchemaOutdatedError(f"暂不支持为 {dialect} 数据库创建表结构，请使用 SQLite 或 PostgreSQL")
+        await conn.execute_script(ddl.format(**DIALECT_TYPES[dialect]))
+    return step
+
+# 按顺序执行的迁移步骤，版本号为序号加一
+# 已经发布的步骤不能修改，只能在末尾追加；每一步都需要能够重复执行
+# 索引和约束的名称与 Tortoise 生成的名称相同，旧版本用 generate_schemas 创建的数据库也能直接升级
+MIGRATIONS: list[tuple[str, Callable[[BaseDBAsyncClient], Awaitable[None]]]] = [
+    ("create tables", _execute("""
+CREATE TABLE IF NOT EXISTS "schema_version" (
+    "version" INT NOT NULL PRIMARY KEY,
+    "description" VARCHAR(255) NOT NULL,
+    "applied_at" {timestamp} NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS "config" (
+    "id" {pk},
+    "chat_id" BIGINT NOT NULL,
+    "actions" {bool},
+    "bitflip" {bool},
+    "link" {bool},
+    "fedi" {bool},
+    "repeater" {bool},
+    "promote" {bool},
+    "stats" {bool},
+    "unpin" {json},
+    "welcome" {json},
+    "anti_anonymous" {bool}
+);
+CREATE INDEX IF NOT EXISTS "idx_config_chat_id_da43ec" ON "config" ("chat_id");
+CREATE TABLE IF NOT EXISTS "channel_whitelist" (
+    "id" {pk},
+    "chat_id" BIGINT NOT NULL,
+    "linked_info" {json},
+    "whitelist" {json},
+    "also_ban" {bool} NOT NULL DEFAULT {false}
+);
+CREATE INDEX IF NOT EXISTS "idx_channel_whi_chat_id_d4398a" ON "channel_whitelist" ("chat_id");
+CREATE TABLE IF NOT EXISTS "stats" (
+    "id" {pk},
+    "chat_id" BIGINT NOT NULL UNIQUE,
+    "chat_title" VARCHAR(1024),
+    "total_messages" INT NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS "idx_stats_chat_id_13bd0e" ON "stats" ("chat_id");
+CREATE TABLE IF NOT EXISTS "chat_user_stats" (
+    "id" {pk},
+    "chat_id" BIGINT NOT NULL,
+    "user_id" BIGINT NOT NULL,
+    "username" VARCHAR(255),
+    "name" VARCHAR(1024),
+    "message_count" INT NOT NULL DEFAULT 0,
+    "xm_count" INT NOT NULL DEFAULT 0,
+    "wocai_count" INT NOT NULL DEFAULT 0,
+    CONSTRAINT "uid_chat_user_s_chat_id_8c9388" UNIQUE ("chat_id", "user_id")
+);
+CREATE INDEX IF NOT EXISTS "idx_chat_user_s_chat_id_1a18e4" ON "chat_user_stats" ("chat_id");
+CREATE TABLE IF NOT EXISTS "chat_activity_buckets" (
+    "id" {pk},
+    "chat_id" BIGINT NOT NULL,
+    "user_id" BIGINT NOT NULL,
+    "bucket" INT NOT NULL,
+    "message_count" INT NOT NULL DEFAULT 0,
+    "rolled_up" {bool} NOT NULL DEFAULT {false},
+    CONSTRAINT "uid_chat_activi_chat_id_954ddd" UNIQUE ("chat_id", "bucket", "user_id")
+);
+CREATE INDEX IF NOT EXISTS "idx_chat_activi_bucket_938488" ON "chat_activity_buckets" ("bucket");
+CREATE TABLE IF NOT EXISTS "chat_daily_stats" (
+    "id" {pk},
+    "chat_id" BIGINT NOT NULL,
+    "user_id" BIGINT NOT NULL,
+    "day" DATE NOT NULL,
+    "message_count" INT NOT NULL DEFAULT 0,
+    CONSTRAINT "uid_chat_daily__chat_id_27be8f" UNIQUE ("chat_id", "day", "user_id")
+);
+CREATE TABLE IF NOT EXISTS "minecraft_bindings" (
+    "id" {pk},
+    "chat_id" BIGINT NOT NULL UNIQUE,
+    "java_server" VARCHAR(255),
+    "bedrock_server" VARCHAR(255)
+);
+CREATE INDEX IF NOT EXISTS "idx_minecraft_b_chat_id_c26d0b" ON "minecraft_bindings" ("chat_id");
+CREATE TABLE IF NOT EXISTS "fedi_clients" (
+    "id" {pk},
+    "instance_domain" VARCHAR(255) NOT NULL UNIQUE,
+    "is_misskey" {bool} NOT NULL DEFAULT {false},
+    "client_id" VARCHAR(255) NOT NULL,
+    "client_secret" VARCHAR(255) NOT NULL
+);
+CREATE TABLE IF NOT EXISTS "fedi_tokens" (
+    "id" {pk},
+    "user_id" BIGINT NOT NULL,
+    "instance_domain" VARCHAR(255) NOT NULL,
+    "access_token" VARCHAR(1024) NOT NULL,
+    CONSTRAINT "uid_fedi_tokens_user_id_58b192" UNIQUE ("user_id", "instance_domain")
+);
+CREATE INDEX IF NOT EXISTS "idx_fedi_tokens_user_id_928a0d" ON "fedi_tokens" ("user_id");
+CREATE TABLE IF NOT EXISTS "lottery" (
+    "id" {pk},
+    "chat_id" BIGINT NOT NULL,
+    "type" VARCHAR(50) NOT NULL,
+    "winner_count" INT NOT NULL DEFAULT 1,
+    "max_participants" INT,
+    "end_time" {timestamp},
+    "title" VARCHAR(1024) NOT NULL,
+    "description" TEXT,
+    "creator" {json},
+    "token" VARCHAR(1024),
+    "participants" {json},
+    "winners" {json},
+    "is_ended" {bool} NOT NULL DEFAULT {false}
+);
+CREATE INDEX IF NOT EXISTS "idx_lottery_chat_id_895f0d" ON "lottery" ("chat_id");
+""")),
+    ("add indexes for lottery and stats queries", _execute("""
+-- get_all_unended_lotteries
+CREATE INDEX IF NOT EXISTS "idx_lottery_is_ende_10e531" ON "lottery" ("is_ended");
+-- get_lottery_info / update_lottery_info / end_lottery
+CREATE INDEX IF NOT EXISTS "idx_lottery_chat_id_2a30dd" ON "lottery" ("chat_id", "id");
+-- get_top_users
+CREATE INDEX IF NOT EXISTS "idx_chat_user_s_chat_id_e51db7" ON "chat_user_stats" ("chat_id", "message_count");
+CREATE INDEX IF NOT EXISTS "idx_chat_user_s_chat_id_886508" ON "chat_user_stats" ("chat_id", "xm_count");
+CREATE INDEX IF NOT EXISTS "idx_chat_user_s_chat_id_c12047" ON "chat_user_stats" ("chat_id", "wocai_count");
+-- rollup_daily_stats / delete_buckets_before
+CREATE INDEX IF NOT EXISTS "idx_chat_activi_rolled__34bc7b" ON "chat_activity_buckets" ("rolled_up", "bucket");
+""")),
+    # state.backend 为 database 时使用的 state_entries 表
+    ("create state table", _execute("""
+CREATE TABLE IF NOT EXISTS "state_entries" (
+    "key" VARCHAR(255) NOT NULL PRIMARY KEY,
+    "value" TEXT NOT NULL,
+    "expires_at" {float}
+);
+CREATE INDEX IF NOT EXISTS "idx_state_entri_expires_de29ba" ON "state_entries" ("expires_at");
+""")),
+    # 短链接展开结果的缓存
+    ("create link expansion cache table", _execute("""
+CREATE TABLE IF NOT EXISTS "link_expansions" (
+    "key" VARCHAR(64) NOT NULL PRIMARY KEY,
+    "url" TEXT NOT NULL,
+    "expanded_url" TEXT,
+    "expires_at" {float} NOT NULL
+);
+CREATE INDEX IF NOT EXISTS "idx_link_expans_expires_54bd43" ON "link_expansions" ("expires_at");
+""")),
+    # 记录每个活跃度桶已经汇总的消息数，汇总之后写入的消息不再丢失
+    ("add rolled_count to activity buckets", _add_rolled_count),
+]
+LATEST_VERSION = len(MIGRATIONS)
+
+
+async def get_schema_version() -> int | None:
+    """
+    Return the applied schema version.
+
+    Databases created before versioned migrations existed are version 0,
+    None means the database is empty.
+    """
+    try:
+        latest = await SchemaVersion.all().order_by('-version').first()
+    except OperationalError:
+        try:
+            await Config.exists()
+        except OperationalError:
+            return None
+        return 0
+    return latest.version if latest else 0
+
+async def run_migrations() -> int:
+    """Apply all pending migrations and return how many were applied."""
+    version = await get_schema_version() or 0
+    conn = connections.get('default')
+    for number, (description, step) in enumerate(MIGRATIONS[version:], version + 1):
+        logging.info(f"正在执行数据库迁移 {number}: {description}")
+        await step(conn)
+        await SchemaVersion.create(version=number, description=description)
+    return max(LATEST_VERSION - version, 0)
+
+async def ensure_schema(auto_migrate: bool = False) -> None:
+    """
+    Check the schema at startup.
+
+    An empty database is always migrated, an outdated one only if auto_migrate
+    is set, otherwise SchemaOutdatedError is raised before the bot starts.
+    """
+    version = await get_schema_version()
+    if version is None or (auto_migrate and version < LATEST_VERSION):
+        await run_migrations()
+    elif version < LATEST_VERSION:
+        raise SchemaOutdatedError(
+            f"数据库结构版本为 {version}，当前程序需要版本 {LATEST_VERSION}。"
+            f"请先备份数据库并运行 `python -m adapters.db.migrations`，或者在配置文件中开启 database.auto_migrate"
+        )
+    elif version > LATEST_VERSION:
+        raise SchemaOutdatedError(f"数据库结构版本 {version} 比当前程序支持的版本 {LATEST_VERSION} 更新，请更新程序")
+
+
+async def main() -> None:
+    from adapters.db.core import init_db, close_db
+    from config import config
+    await init_db(config.get_config_value('database', {}), auto_migrate=True)
+    print(f"Database schema is at version {await get_schema_version()}.")
+    await close_db()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
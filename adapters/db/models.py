@@ -21,13 +21,52 @@ class Stats(models.Model):
     chat_id = fields.BigIntField(index=True,unique=True)
     chat_title = fields.CharField(null=True,max_length=1024)
     total_messages = fields.IntField(default=0)
-    messages_24h = fields.JSONField(null=True,default=dict)
-    users = fields.JSONField(null=True,default=dict)
-    messages = fields.JSONField(null=True,default=dict)
 
     class Meta:
         table = "stats"
 
+class ChatUserStats(models.Model):
+    chat_id = fields.BigIntField(index=True)
+    user_id = fields.BigIntField()
+    username = fields.CharField(null=True,max_length=255)
+    name = fields.CharField(null=True,max_length=1024)
+    message_count = fields.IntField(default=0)
+    xm_count = fields.IntField(default=0)
+    wocai_count = fields.IntField(default=0)
+
+    class Meta:
+        table = "chat_user_stats"
+        unique_together = (("chat_id", "user_id"),)
+        # 排行榜直接用 ORDER BY ... LIMIT 走索引
+        indexes = (("chat_id", "message_count"), ("chat_id", "xm_count"), ("chat_id", "wocai_count"))
+
+class ChatActivityBucket(models.Model):
+    chat_id = fields.BigIntField()
+    user_id = fields.BigIntField()
+    # 桶编号，即 unix 时间戳整除桶的长度
+    bucket = fields.IntField(index=True)
+    message_count = fields.IntField(default=0)
+    # 已经汇总到每日统计中的消息数，汇总之后桶里还可能加入延迟写入的消息
+    rolled_count = fields.IntField(default=0)
+    # 是否已经全部汇总到每日统计中，即 rolled_count 等于 message_count
+    rolled_up = fields.BooleanField(default=False)
+
+    class Meta:
+        table = "chat_activity_buckets"
+        unique_together = (("chat_id", "bucket", "user_id"),)
+        # 定时汇总和清理时按是否已汇总和桶编号查找
+        indexes = (("rolled_up", "bucket"),)
+
+class ChatDailyStats(models.Model):
+    chat_id = fields.BigIntField()
+    user_id = fields.BigIntField()
+    day = fields.DateField()
+    message_count = fields.IntField(default=0)
+
+    class Meta:
+        table = "chat_daily_stats"
+        unique_together = (("chat_id", "day", "user_id"),)
+
 class MinecraftBindings(models.Model):
     chat_id = fields.BigIntField(index=True,unique=True)
     java_server = fields.CharField(max_length=255,null=True)
@@ -53,7 +92,7 @@ class FediUserTokens(models.Model):
 
 class ChannelWhiteList(models.Model):
     chat_id = fields.BigIntField(index=True)
-    linked_info = fields.JSONField(null=True,default=lambda: {"id": None, "fullname": None, "username": None})
+    linked_info = fields.JSONField(null=True,default=lambda: {"id": None, "fullname": None, "username": None, "raw_fullname": None})
     whitelist = fields.JSONField(null=True,default=list)
     also_ban = fields.BooleanField(default=False)
 
@@ -75,4 +114,36 @@ class Lottery(models.Model):
     is_ended = fields.BooleanField(default=False)
 
     class Meta:
-        table = "lottery"
\ No newline at end of file
+        table = "lottery"
+        # 启动时恢复未结束的抽奖，以及按群组和 ID 查找抽奖
+        indexes = (("is_ended",), ("chat_id", "id"))
+
+
+class SchemaVersion(models.Model):
+    version = fields.IntField(pk=True, generated=False)
+    description = fields.CharField(max_length=255)
+    applied_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "schema_version"
+
+class StateEntry(models.Model):
+    key = fields.CharField(pk=True, max_length=255)
+    value = fields.TextField()
+    # unix 时间戳，为空表示不会过期
+    expires_at = fields.FloatField(null=True, index=True)
+
+    class Meta:
+        table = "state_entries"
+
+class LinkExpansion(models.Model):
+    # 输入链接的 sha256，链接可能比索引允许的长度更长
+    key = fields.CharField(pk=True, max_length=64)
+    url = fields.TextField()
+    # 展开后的链接，为空表示没有跳转
+    expanded_url = fields.TextField(null=True)
+    # unix 时间戳
+    expires_at = fields.FloatField(index=True)
+
+    class Meta:
+        table = "link_expansions"
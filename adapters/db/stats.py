@@ -1,55 +1,185 @@
-from adapters.db.models import Stats
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
 
-async def get_group_stats(chat_id: int) -> dict[str, dict]:
-    """Retrieve statistics for a specific group chat by chat_id."""
-    stats = await Stats.get(chat_id=chat_id).values()
-    return stats
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F
+from tortoise.functions import Sum, Count
+from tortoise.transactions import in_transaction
 
-async def get_24h_message_stats(chat_id: int) -> dict:
-    """Retrieve 24-hour message statistics for a specific group chat."""
-    stats = await Stats.get(chat_id=chat_id)
-    return stats.messages_24h or {}
+from adapters.db.models import Stats, ChatUserStats, ChatActivityBucket, ChatDailyStats
+
+USER_COUNTERS = ("message_count", "xm_count", "wocai_count")
+# 24 小时的活跃度按 5 分钟一个桶记录，过期时整桶删除
+BUCKET_SECONDS = 300
+WINDOW_BUCKETS = 24 * 3600 // BUCKET_SECONDS
+# 每日统计按这个时区划分日期
+STATS_TZ = ZoneInfo("Asia/Shanghai")
+
+def current_bucket(now: float | None = None) -> int:
+    """Return the bucket number that the given unix time (default: now) falls into."""
+    return int((time.time() if now is None else now) // BUCKET_SECONDS)
+
+async def _increment_or_create(model, lookup: dict, counters: dict[str, int], values: dict) -> None:
+    """Atomically add counters to the row matching lookup, creating it if it does not exist."""
+    updates = {k: F(k) + v for k, v in counters.items()}
+    if await model.filter(**lookup).update(**updates, **values):
+        return
+    try:
+        # 在保存点中插入：PostgreSQL 中插入失败会中止整个事务，回滚到保存点之后才能继续更新
+        async with in_transaction():
+            await model.create(**lookup, **counters, **values)
+    except IntegrityError:
+        # 并发插入时另一方已经建好了这一行，再更新一次即可
+        await model.filter(**lookup).update(**updates, **values)
+
+async def get_group_stats(chat_id: int) -> dict | None:
+    """Retrieve chat-level statistics for a specific group chat by chat_id."""
+    return await Stats.get_or_none(chat_id=chat_id).values()
+
+async def count_users(chat_id: int, counter: str | None = None) -> int:
+    """Count the users of a group chat, optionally only those with a non-zero counter."""
+    query = ChatUserStats.filter(chat_id=chat_id)
+    if counter is not None:
+        if counter not in USER_COUNTERS:
+            raise ValueError(f"Unknown counter: {counter}")
+        query = query.filter(**{f"{counter}__gt": 0})
+    return await query.count()
+
+async def get_top_users(chat_id: int, counter: str, limit: int = 10, offset: int = 0) -> list[dict]:
+    """Retrieve the users with the highest non-zero value of a counter, in descending order."""
+    if counter not in USER_COUNTERS:
+        raise ValueError(f"Unknown counter: {counter}")
+    return await (ChatUserStats.filter(chat_id=chat_id, **{f"{counter}__gt": 0})
+                  .order_by(f"-{counter}", "id")
+                  .offset(offset)
+                  .limit(limit)
+                  .values("user_id", "username", "name", counter))
+
+async def get_users_by_ids(chat_id: int, user_ids: list[int]) -> dict[int, dict]:
+    """Retrieve name information of the given users in a group chat."""
+    rows = await ChatUserStats.filter(chat_id=chat_id, user_id__in=user_ids).values("user_id", "username", "name")
+    return {row["user_id"]: row for row in rows}
 
 async def get_user_stats(chat_id: int, user_id: int) -> dict:
     """Retrieve statistics for a specific user in a group chat."""
-    stats = await Stats.get(chat_id=chat_id)
-    users_data = stats.users
-    if users_data and str(user_id) in users_data:
-        return users_data[str(user_id)]
-    return {}
+    stats = await ChatUserStats.get_or_none(chat_id=chat_id, user_id=user_id).values()
+    return stats or {}
+
+async def get_24h_message_stats(chat_id: int) -> dict[int, int]:
+    """Retrieve per-user message counts of the last 24 hours for a specific group chat."""
+    first_bucket = current_bucket() - WINDOW_BUCKETS + 1
+    rows = await (ChatActivityBucket.filter(chat_id=chat_id, bucket__gte=first_bucket)
+                  .annotate(total=Sum("message_count"))
+                  .group_by("user_id")
+                  .values("user_id", "total"))
+    return {row["user_id"]: row["total"] for row in rows}
 
-async def update_group_stats(chat_id: int, user_id: int) -> None:
+async def get_24h_summary(chat_id: int) -> tuple[int, int]:
+    """Retrieve (message count, active user count) of the last 24 hours for a specific group chat."""
+    first_bucket = current_bucket() - WINDOW_BUCKETS + 1
+    rows = await (ChatActivityBucket.filter(chat_id=chat_id, bucket__gte=first_bucket)
+                  .annotate(total=Sum("message_count"), users=Count("user_id", distinct=True))
+                  .values("total", "users"))
+    if not rows:
+        return 0, 0
+    return rows[0]["total"] or 0, rows[0]["users"] or 0
+
+async def get_24h_top_users(chat_id: int, limit: int = 10) -> list[tuple[int, int]]:
+    """Retrieve the (user_id, message count) pairs of the most active users in the last 24 hours."""
+    first_bucket = current_bucket() - WINDOW_BUCKETS + 1
+    rows = await (ChatActivityBucket.filter(chat_id=chat_id, bucket__gte=first_bucket)
+                  .annotate(total=Sum("message_count"))
+                  .group_by("user_id")
+                  .order_by("-total")
+                  .limit(limit)
+                  .values("user_id", "total"))
+    return [(row["user_id"], row["total"]) for row in rows]
+
+async def update_group_stats(chat_id: int, user_id: int, chat_title: str | None = None) -> None:
     """Update statistics for a specific group chat."""
-    from datetime import datetime
-    stats = await Stats.get(chat_id=chat_id)
-    # JSON 只能使用字符串作为键，所以将 user_id 转换为字符串
-    uid = str(user_id)
-    stats.total_messages = (stats.total_messages or 0) + 1
-    messages_24h = stats.messages_24h or {"messages": [], "message_count": 0, "active_users": {}}
-    messages_24h["message_count"] = messages_24h["message_count"] + 1
-    messages_24h["active_users"][uid] = messages_24h["active_users"].get(uid, 0) + 1
-    messages_24h["messages"].append({"user_id": user_id, "timestamp": datetime.now().isoformat()})
-    stats.messages_24h = messages_24h
-    await stats.save()
-
-async def update_24h_message(chat_id: int, data: dict) -> None:
-    """Update the 24-hour message count for a specific group chat."""
-    stats = await Stats.get(chat_id=chat_id)
-    stats.messages_24h = data
-    await stats.save()
+    values = {"chat_title": chat_title} if chat_title else {}
+    await _increment_or_create(Stats, {"chat_id": chat_id}, {"total_messages": 1}, values)
+    await _increment_or_create(ChatActivityBucket, {"chat_id": chat_id, "user_id": user_id, "bucket": current_bucket()}, {"message_count": 1}, {"rolled_up": False})
+
+async def delete_buckets_before(bucket: int) -> None:
+    """Drop all fully rolled-up activity buckets older than the given bucket number."""
+    await ChatActivityBucket.filter(bucket__lt=bucket, rolled_up=True, rolled_count=F("message_count")).delete()
+
+def bucket_day(bucket: int) -> date:
+    """Return the day (in STATS_TZ) that a bucket belongs to."""
+    return datetime.fromtimestamp(bucket * BUCKET_SECONDS, tz=STATS_TZ).date()
+
+async def rollup_daily_stats(before_bucket: int) -> int:
+    """
+    Add the messages of the buckets older than before_bucket that were not
+    rolled up yet to the daily stats, returning how many buckets were rolled up.
+    """
+    async with in_transaction():
+        rows = await (ChatActivityBucket.filter(rolled_up=False, bucket__lt=before_bucket)
+                      .values("id", "chat_id", "user_id", "bucket", "message_count", "rolled_count"))
+        daily: defaultdict[tuple[int, date, int], int] = defaultdict(int)
+        ids = []
+        for row in rows:
+            if row["message_count"] == row["rolled_count"]:
+                continue
+            # 只汇总上次汇总之后加入的消息；以读到的 rolled_count 为条件，另一个实例同时汇总时只有一方生效
+            if not await (ChatActivityBucket.filter(id=row["id"], rolled_count=row["rolled_count"])
+                          .update(rolled_count=row["message_count"])):
+                continue
+            daily[(row["chat_id"], bucket_day(row["bucket"]), row["user_id"])] += row["message_count"] - row["rolled_count"]
+            ids.append(row["id"])
+        for (chat_id, day, user_id), count in daily.items():
+            await _increment_or_create(ChatDailyStats, {"chat_id": chat_id, "day": day, "user_id": user_id}, {"message_count": count}, {})
+        # 汇总期间又有新消息写入的桶保持未汇总的状态，留给下一次汇总
+        for i in range(0, len(rows), 500):
+            await (ChatActivityBucket.filter(id__in=[row["id"] for row in rows[i:i + 500]], rolled_count=F("message_count"))
+                   .update(rolled_up=True))
+    return len(ids)
+
+async def get_range_summary(chat_id: int, start: date, end: date) -> tuple[int, int]:
+    """Retrieve (message count, active user count) of a group chat between two days, inclusive."""
+    rows = await (ChatDailyStats.filter(chat_id=chat_id, day__gte=start, day__lte=end)
+                  .annotate(total=Sum("message_count"), users=Count("user_id", distinct=True))
+                  .values("total", "users"))
+    if not rows:
+        return 0, 0
+    return rows[0]["total"] or 0, rows[0]["users"] or 0
+
+async def get_range_top_users(chat_id: int, start: date, end: date, limit: int = 10) -> list[tuple[int, int]]:
+    """Retrieve the (user_id, message count) pairs of the most active users between two days, inclusive."""
+    rows = await (ChatDailyStats.filter(chat_id=chat_id, day__gte=start, day__lte=end)
+                  .annotate(total=Sum("message_count"))
+                  .group_by("user_id")
+                  .order_by("-total")
+                  .limit(limit)
+                  .values("user_id", "total"))
+    return [(row["user_id"], row["total"]) for row in rows]
 
 async def update_user_stats(chat_id: int, user_id: int, username: str, name: str,attr: None | str) -> None:
     """Update statistics for a specific user in a group chat."""
-    stats = await Stats.get(chat_id=chat_id)
-    users_data = stats.users or {}
-    uid = str(user_id)
-    user_data = users_data.get(uid, {})
+    lookup = {"chat_id": chat_id, "user_id": user_id}
     if not attr:
-        user_data["username"] = username
-        user_data["name"] = name
-        user_data["message_count"] = user_data.get("message_count", 0) + 1
+        await _increment_or_create(ChatUserStats, lookup, {"message_count": 1}, {"username": username, "name": name})
     elif attr in ("xm_count","wocai_count"):
-        user_data[attr] = user_data.get(attr, 0) + 1
-    users_data[uid] = user_data
-    stats.users = users_data
-    await stats.save()
\ No newline at end of file
+        await _increment_or_create(ChatUserStats, lookup, {attr: 1}, {})
+
+async def apply_stats_batch(chat_deltas: dict[int, int], chat_titles: dict[int, str],
+                            user_deltas: dict[tuple[int, int], dict[str, int]],
+                            user_names: dict[tuple[int, int], tuple[str | None, str]],
+                            bucket_deltas: dict[tuple[int, int, int], int]) -> None:
+    """Apply accumulated stats deltas in a single transaction."""
+    async with in_transaction():
+        for chat_id, delta in chat_deltas.items():
+            values = {"chat_title": chat_titles[chat_id]} if chat_id in chat_titles else {}
+            await _increment_or_create(Stats, {"chat_id": chat_id}, {"total_messages": delta}, values)
+        for (chat_id, user_id), counters in user_deltas.items():
+            values = {}
+            if (chat_id, user_id) in user_names:
+                username, name = user_names[(chat_id, user_id)]
+                values = {"username": username, "name": name}
+            await _increment_or_create(ChatUserStats, {"chat_id": chat_id, "user_id": user_id}, counters, values)
+        for (chat_id, user_id, bucket), delta in bucket_deltas.items():
+            # 已经汇总过的桶加入新消息后需要再次汇总
+            await _increment_or_create(ChatActivityBucket, {"chat_id": chat_id, "user_id": user_id, "bucket": bucket}, {"message_count": delta}, {"rolled_up": False})
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from adapters.db.stats import apply_stats_batch, current_bucket, delete_buckets_before, WINDOW_BUCKETS
+
+
+class StatsBuffer:
+    """
+    Write-behind buffer for message stats.
+
+    Counter deltas are accumulated in memory per (chat, user, attr) and written
+    to the database in one transaction every `flush_interval` seconds, or as soon
+    as `max_events` messages are pending.
+    """
+
+    def __init__(self, flush_interval: float = 5, max_events: int = 200):
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        self._reset()
+        # 每个群组已记录的消息数，用作统计数据的版本号
+        self.versions: defaultdict[int, int] = defaultdict(int)
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self._expired_before: int | None = None
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    def _reset(self) -> None:
+        self._chat_deltas: defaultdict[int, int] = defaultdict(int)
+        self._chat_titles: dict[int, str] = {}
+        self._user_deltas: defaultdict[tuple[int, int], defaultdict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._user_names: dict[tuple[int, int], tuple[str | None, str]] = {}
+        self._bucket_deltas: defaultdict[tuple[int, int, int], int] = defaultdict(int)
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def record_message(self, chat_id: int, user_id: int, username: str | None, name: str,
+                       chat_title: str | None = None, counters: tuple[str, ...] = ()) -> None:
+        """Record one group message and the extra counters (e.g. xm_count) it hit."""
+        key = (chat_id, user_id)
+        self._chat_deltas[chat_id] += 1
+        self.versions[chat_id] += 1
+        if chat_title:
+            self._chat_titles[chat_id] = chat_title
+        self._user_deltas[key]["message_count"] += 1
+        for attr in counters:
+            self._user_deltas[key][attr] += 1
+        self._user_names[key] = (username, name)
+        self._bucket_deltas[(chat_id, user_id, current_bucket())] += 1
+        self._pending += 1
+
+        self._ensure_task()
+        if self.pending >= self.max_events:
+            self._wakeup.set()
+
+    def _ensure_task(self) -> None:
+        if self._closing:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logging.exception("写入统计数据时出错，将在下次重试")
+
+    async def flush(self) -> None:
+        """Write all pending deltas to the database."""
+        async with self._lock:
+            await self._expire_buckets()
+            if not self._pending:
+                return
+            chat_deltas, chat_titles = self._chat_deltas, self._chat_titles
+            user_deltas, user_names = self._user_deltas, self._user_names
+            bucket_deltas, pending = self._bucket_deltas, self._pending
+            self._reset()
+            try:
+                await apply_stats_batch(chat_deltas, chat_titles, user_deltas, user_names, bucket_deltas)
+            except BaseException:
+                # 写入失败或被取消时把这批数据放回缓冲区，避免丢失
+                for chat_id, delta in chat_deltas.items():
+                    self._chat_deltas[chat_id] += delta
+                self._chat_titles = chat_titles | self._chat_titles
+                for key, counters in user_deltas.items():
+                    for attr, delta in counters.items():
+                        self._user_deltas[key][attr] += delta
+                self._user_names = user_names | self._user_names
+                for key, delta in bucket_deltas.items():
+                    self._bucket_deltas[key] += delta
+                self._pending += pending
+                raise
+
+    async def _expire_buckets(self) -> None:
+        """Drop the buckets that left the 24h window, at most once per bucket."""
+        first_bucket = current_bucket() - WINDOW_BUCKETS + 1
+        if self._expired_before == first_bucket:
+            return
+        await delete_buckets_before(first_bucket)
+        self._expired_before = first_bucket
+
+    async def close(self) -> None:
+        """Stop the periodic flush and write whatever is still pending."""
+        # 不直接取消后台任务，避免在事务进行到一半时打断数据库连接
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
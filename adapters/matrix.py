@@ -129,7 +129,7 @@ Available commands:
 async def main():
     """Main function to run the bot."""
     # 从环境变量或配置文件中获取值
-    matrix_config = config.Config().get_config_value('matrix', {})
+    matrix_config = config.config.get_config_value('matrix', {})
     homeserver = matrix_config.get('homeserver', "https://matrix.org")
     user_id = matrix_config.get('user_id')
     token = os.getenv("MATRIX_BOT_TOKEN")
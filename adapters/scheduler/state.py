@@ -0,0 +1,21 @@
+import logging
+
+from adapters.scheduler.core import Scheduler
+from adapters.state.core import StateBackend
+
+async def purge_state_job(backend: StateBackend) -> None:
+    """Delete the expired keys of the state backend."""
+    count = await backend.purge_expired()
+    logging.debug(f"已清理 {count} 条过期的状态")
+
+def start_state_purge_job(backend: StateBackend) -> None:
+    """Purge expired state every hour."""
+    Scheduler.scheduler.add_job(
+        func=purge_state_job,
+        args=(backend,),
+        trigger='cron',
+        minute=30,
+        id='state_purge',
+        replace_existing=True,
+        executor='default'
+    )
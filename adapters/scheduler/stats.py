@@ -0,0 +1,23 @@
+import logging
+
+from adapters.scheduler.core import Scheduler
+from adapters.db.stats import rollup_daily_stats, current_bucket
+
+# 汇总时跳过最近的几个桶，给内存中尚未写入的统计留出时间
+ROLLUP_GRACE_BUCKETS = 2
+
+async def rollup_stats_job() -> None:
+    """Compact finished activity buckets into the daily stats."""
+    count = await rollup_daily_stats(current_bucket() - ROLLUP_GRACE_BUCKETS)
+    logging.debug(f"已将 {count} 个活跃度桶汇总到每日统计")
+
+def start_stats_rollup_job() -> None:
+    """Run the daily stats rollup every 10 minutes."""
+    Scheduler.scheduler.add_job(
+        func=rollup_stats_job,
+        trigger='cron',
+        minute='*/10',
+        id='stats_rollup',
+        replace_existing=True,
+        executor='default'
+    )
@@ -0,0 +1,66 @@
+from abc import ABC, abstractmethod
+
+
+class StateBackend(ABC):
+    """
+    Key-value store for bot state that may be shared between processes.
+
+    Values are strings, callers encode anything more complex themselves.
+    A ttl in seconds makes a key expire, None keeps it until deleted.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> str | None:
+        """Return the value of key, or None if it's missing or expired."""
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        """Set key to value, replacing any previous value."""
+
+    @abstractmethod
+    async def set_if_absent(self, key: str, value: str, ttl: float | None = None) -> bool:
+        """Atomically set key only if it doesn't exist yet, returning whether it was set."""
+
+    @abstractmethod
+    async def compare_and_set(self, key: str, expected: str | None, value: str, ttl: float | None = None) -> bool:
+        """
+        Atomically set key to value only if its current value is expected,
+        None meaning missing or expired. Returns whether it was set.
+        """
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Delete key if it exists."""
+
+    async def purge_expired(self) -> int:
+        """Delete expired keys the backend doesn't drop by itself, returning how many were deleted."""
+        return 0
+
+    async def close(self) -> None:
+        """Release the resources held by the backend."""
+
+    @property
+    def shared(self) -> bool:
+        """Whether other processes see the same state."""
+        return True
+
+
+def create_state_backend(settings: dict | None = None) -> StateBackend:
+    """
+    Create the backend selected by the `state` section of config.yaml.
+
+    `backend` is one of memory (default), database or redis; redis reads
+    the server address from `redis_url`.
+    """
+    settings = settings or {}
+    backend = settings.get('backend', 'memory')
+    if backend == 'memory':
+        from adapters.state.memory import MemoryStateBackend
+        return MemoryStateBackend(max_entries=settings.get('max_entries', 100000))
+    if backend == 'database':
+        from adapters.state.database import DatabaseStateBackend
+        return DatabaseStateBackend()
+    if backend == 'redis':
+        from adapters.state.redis import RedisStateBackend
+        return RedisStateBackend(settings.get('redis_url', 'redis://localhost:6379/0'))
+    raise ValueError(f"Unknown state backend: {backend}")
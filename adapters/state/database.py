@@ -0,0 +1,51 @@
+import time
+
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Q
+
+from adapters.db.models import StateEntry
+from adapters.state.core import StateBackend
+
+
+class DatabaseStateBackend(StateBackend):
+    """State stored in the bot's database (SQLite by default), shared by every process using it."""
+
+    async def get(self, key: str) -> str | None:
+        entry = await StateEntry.get_or_none(key=key).values('value', 'expires_at')
+        if entry is None:
+            return None
+        if entry['expires_at'] is not None and entry['expires_at'] <= time.time():
+            await StateEntry.filter(key=key, expires_at__lte=time.time()).delete()
+            return None
+        return entry['value']
+
+    async def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        await StateEntry.update_or_create(key=key, defaults={'value': value, 'expires_at': expires_at})
+
+    async def set_if_absent(self, key: str, value: str, ttl: float | None = None) -> bool:
+        now = time.time()
+        # 已经过期的记录视为不存在
+        await StateEntry.filter(key=key, expires_at__lte=now).delete()
+        try:
+            await StateEntry.create(key=key, value=value, expires_at=now + ttl if ttl is not None else None)
+        except IntegrityError:
+            return False
+        return True
+
+    async def compare_and_set(self, key: str, expected: str | None, value: str, ttl: float | None = None) -> bool:
+        if expected is None:
+            return await self.set_if_absent(key, value, ttl)
+        now = time.time()
+        # 单条 UPDATE 带上旧值作为条件，由数据库保证原子性
+        updated = await StateEntry.filter(
+            Q(expires_at__isnull=True) | Q(expires_at__gt=now), key=key, value=expected
+        ).update(value=value, expires_at=now + ttl if ttl is not None else None)
+        return updated > 0
+
+    async def delete(self, key: str) -> None:
+        await StateEntry.filter(key=key).delete()
+
+    async def purge_expired(self) -> int:
+        """Delete all expired keys and return how many were deleted."""
+        return await StateEntry.filter(expires_at__lte=time.time()).delete()
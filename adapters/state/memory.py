@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict
+
+from adapters.state.core import StateBackend
+
+
+class MemoryStateBackend(StateBackend):
+    """Process-local state, lost on restart. Least recently used keys are dropped above max_entries."""
+
+    def __init__(self, max_entries: int = 100000):
+        # key -> (值, 过期时间)，按最近使用的顺序排列
+        self._data: OrderedDict[str, tuple[str, float | None]] = OrderedDict()
+        self.max_entries = max_entries
+
+    @property
+    def shared(self) -> bool:
+        return False
+
+    def _get_entry(self, key: str) -> tuple[str, float | None] | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def _put(self, key: str, value: str, ttl: float | None) -> None:
+        self._data[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def get(self, key: str) -> str | None:
+        entry = self._get_entry(key)
+        return entry[0] if entry else None
+
+    async def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        self._put(key, value, ttl)
+
+    async def set_if_absent(self, key: str, value: str, ttl: float | None = None) -> bool:
+        if self._get_entry(key) is not None:
+            return False
+        self._put(key, value, ttl)
+        return True
+
+    async def compare_and_set(self, key: str, expected: str | None, value: str, ttl: float | None = None) -> bool:
+        entry = self._get_entry(key)
+        if (entry[0] if entry else None) != expected:
+            return False
+        self._put(key, value, ttl)
+        return True
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def purge_expired(self) -> int:
+        now = time.monotonic()
+        expired = [key for key, (_, expires_at) in self._data.items() if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
@@ -0,0 +1,139 @@
+import asyncio
+from urllib.parse import urlparse, unquote
+
+from adapters.state.core import StateBackend
+
+
+class RedisError(Exception):
+    """Error reply returned by the Redis server."""
+
+
+# compare_and_set 在服务端执行的脚本，ARGV: 是否要求不存在、旧值、新值、毫秒数（空字符串表示不过期）
+_COMPARE_AND_SET_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if ARGV[1] == '1' then
+    if current then return 0 end
+elseif current ~= ARGV[2] then
+    return 0
+end
+if ARGV[4] == '' then
+    redis.call('SET', KEYS[1], ARGV[3])
+else
+    redis.call('SET', KEYS[1], ARGV[3], 'PX', ARGV[4])
+end
+return 1
+"""
+
+
+def _milliseconds(ttl: float) -> str:
+    return str(max(int(ttl * 1000), 1))
+
+
+class RedisStateBackend(StateBackend):
+    """
+    State stored in Redis, or any server speaking the Redis protocol.
+
+    Uses a single connection with one command in flight at a time, which is
+    plenty for the few commands the bot sends per update.
+    """
+
+    def __init__(self, url: str = 'redis://localhost:6379/0'):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            auth = ('AUTH', self.username, self.password) if self.username else ('AUTH', self.password)
+            await self._send(*auth)
+        if self.db:
+            await self._send('SELECT', str(self.db))
+
+    async def _send(self, *args: str):
+        payload = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg.encode()
+            payload.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._writer.write(b"".join(payload))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis 连接已断开")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b'+':
+            return body.decode()
+        if prefix == b'-':
+            raise RedisError(body.decode())
+        if prefix == b':':
+            return int(body)
+        if prefix == b'$':
+            length = int(body)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode()
+        if prefix == b'*':
+            length = int(body)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise RedisError(f"无法解析的 Redis 响应: {line!r}")
+
+    async def execute(self, *args: str):
+        """Send one command and return its decoded reply."""
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await self._connect()
+                return await self._send(*args)
+            except RedisError:
+                # 服务端返回的错误已经完整读取，连接仍然可用
+                raise
+            except BaseException:
+                # 连接出错或者命令被取消时，响应可能还没有读取，留下的连接会把它当成下一条命令的响应，
+                # 所以丢弃连接，下一条命令重新连接
+                self._close_connection()
+                raise
+
+    def _close_connection(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def get(self, key: str) -> str | None:
+        return await self.execute('GET', key)
+
+    async def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        if ttl is None:
+            await self.execute('SET', key, value)
+        else:
+            await self.execute('SET', key, value, 'PX', _milliseconds(ttl))
+
+    async def set_if_absent(self, key: str, value: str, ttl: float | None = None) -> bool:
+        args = ['SET', key, value, 'NX']
+        if ttl is not None:
+            args += ['PX', _milliseconds(ttl)]
+        return await self.execute(*args) is not None
+
+    async def compare_and_set(self, key: str, expected: str | None, value: str, ttl: float | None = None) -> bool:
+        return await self.execute(
+            'EVAL', _COMPARE_AND_SET_SCRIPT, '1', key,
+            '1' if expected is None else '0', expected or '', value, '' if ttl is None else _milliseconds(ttl)
+        ) == 1
+
+    async def delete(self, key: str) -> None:
+        await self.execute('DEL', key)
+
+    async def close(self) -> None:
+        async with self._lock:
+            self._close_connection()
@@ -0,0 +1,50 @@
+import json
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from adapters.state.core import StateBackend
+
+
+class BackendStorage(BaseStorage):
+    """aiogram FSM storage on top of a StateBackend, so wizard progress survives restarts and is shared by replicas."""
+
+    def __init__(self, backend: StateBackend, ttl: float | None = 86400, key_builder: KeyBuilder | None = None):
+        """
+        Args:
+            backend: where states and data are stored
+            ttl: seconds an unfinished conversation is kept, None keeps it forever
+            key_builder: builds backend keys from aiogram storage keys
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(prefix='fsm')
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        backend_key = self.key_builder.build(key, 'state')
+        state = state.state if isinstance(state, State) else state
+        if state is None:
+            await self.backend.delete(backend_key)
+        else:
+            await self.backend.set(backend_key, state, self.ttl)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self.backend.get(self.key_builder.build(key, 'state'))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        backend_key = self.key_builder.build(key, 'data')
+        if not data:
+            await self.backend.delete(backend_key)
+        else:
+            await self.backend.set(backend_key, json.dumps(data, ensure_ascii=False), self.ttl)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        value = await self.backend.get(self.key_builder.build(key, 'data'))
+        return json.loads(value) if value else {}
+
+    async def close(self) -> None:
+        await self.backend.close()
@@ -11,6 +11,9 @@ from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram import F
 
 from adapters.scheduler.core import get_all_unended_jobs, Scheduler
+from adapters.state.core import create_state_backend
+from adapters.state.storage import BackendStorage
+from config import config
 from core.anti_fake_users import handle_anonymous_channel_msgs, handle_channel_manage_command
 from core.cfg import handle_config_command
 from core.inline import handle_inline_query
@@ -18,6 +21,7 @@ from core.ip import handle_ip_command
 from core.lottery import router as lottery_router, handle_lottery_command
 from core.mc import handle_mc_status_command
 from core.middleware.anti_fake_channel import AntiFakeChannelUsersMiddleware
+from core.middleware.features import FeatureContextMiddleware
 from core.post_to_fedi import router as fedi_router
 
 from core.bitflip import handle_bitflip_command
@@ -29,7 +33,7 @@ from core.report_links import report_broken_links
 from core.simple import handle_start_command, handle_baka, dummy_handler, handle_info_command, handle_ping_command, \
     handle_tips_command, handle_about_command, handle_nexusmods_id
 from core.actions import handle_actions, handle_reverse_actions
-from core.stats import handle_stats_command
+from core.stats import handle_stats_command, handle_stats_callback
 from core.middleware.stats import MessageStatsMiddleware
 from core.middleware.unpin import UnpinChannelMsgMiddleware
 from core.welcome import handle_tg_welcome
@@ -40,7 +44,13 @@ TOKEN = getenv("BOT_TOKEN")
 class TelegramAdapter:
     bot = None
     def __init__(self):
-        self.dp = Dispatcher()
+        self.state_backend = create_state_backend(config.get_config_value('state', {}))
+        # 共享的状态存储同时用来保存抽奖、联邦宇宙登录等多步操作的进度
+        if self.state_backend.shared:
+            self.dp = Dispatcher(storage=BackendStorage(self.state_backend))
+        else:
+            self.dp = Dispatcher()
+        self.feature_context_middleware = FeatureContextMiddleware()
         self.stats_middleware = MessageStatsMiddleware()
         self.channel_unpin_middleware = UnpinChannelMsgMiddleware()
         self.anti_fake_channel_middleware = AntiFakeChannelUsersMiddleware()
@@ -60,6 +70,10 @@ class TelegramAdapter:
         """Run tasks after bot has started."""
         pending = await get_all_unended_jobs()
         Scheduler().start()
+        from adapters.scheduler.stats import start_stats_rollup_job
+        start_stats_rollup_job()
+        from adapters.scheduler.state import start_state_purge_job
+        start_state_purge_job(self.state_backend)
         if pending:
             logging.info("Recovering jobs...")
             from adapters.scheduler.lottery import recover_lottery_jobs
@@ -88,6 +102,7 @@ class TelegramAdapter:
         router.message(Command('t'))(handle_promote_command)
         # stats 模块
         router.message(Command('stats'))(handle_stats_command)
+        router.callback_query(F.data.startswith('stats:'))(handle_stats_callback)
         # fedi 模块
         router.message(Command('fauth'))(handle_auth)
         router.message(Command('post'))(handle_post_to_fedi)
@@ -110,7 +125,7 @@ class TelegramAdapter:
         router.message(Command('fake'))(handle_channel_manage_command)
         anti_anonymous_router.message(F.chat.type.in_({'group', 'supergroup'}) & F.sender_chat & ~F.is_automatic_forward)(handle_anonymous_channel_msgs)
 
-        repeater_router.message(F.chat.type.in_({'group', 'supergroup'}))(MessageRepeater().handle_message)
+        repeater_router.message(F.chat.type.in_({'group', 'supergroup'}))(MessageRepeater(state=self.state_backend).handle_message)
         router.message(F.text.regexp(r'(n|N) ?网尾号 ?[0-9]*'))(handle_nexusmods_id)
         # welcome 模块
         router.chat_member(ChatMemberUpdatedFilter(IS_NOT_MEMBER >> IS_MEMBER))(handle_tg_welcome)
@@ -141,6 +156,7 @@ class TelegramAdapter:
 
     def _setup_middleware(self):
         """注册中间件"""
+        self.dp.update.outer_middleware(self.feature_context_middleware)
         self.dp.message.middleware(self.stats_middleware)
         self.dp.message.middleware(self.channel_unpin_middleware)
         self.dp.message.middleware(self.anti_fake_channel_middleware)
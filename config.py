@@ -1,16 +1,174 @@
+import asyncio
 import logging
 
 import yaml
 from typing import Dict, Any, Optional, Union
 from pathlib import Path
 
-from adapters.db.config import get_config_value, get_config
+from adapters.db.config import get_config, is_boolean_feature, add_invalidation_listener
+
+
+def _fill_none(primary: Dict[str, Any], fallback: Dict[str, Any]) -> Dict[str, Any]:
+    if not isinstance(primary, dict):
+        return primary if primary is not None else fallback
+    result: Dict[str, Any] = {}
+    for k, v in primary.items():
+        fb = fallback.get(k) if isinstance(fallback, dict) else None
+        if isinstance(v, dict) and isinstance(fb, dict):
+            result[k] = _fill_none(v, fb)
+        else:
+            result[k] = v if v is not None else fb
+    # include keys only present in fallback
+    if isinstance(fallback, dict):
+        for k, v in fallback.items():
+            if k not in result:
+                result[k] = v
+    return result
+
+def _normalize_enabled_dicts(cfg: Any) -> Any:
+    """
+    Convert dicts of the form {'enable': bool} into the bool value,
+    and recurse into nested dicts to normalize values.
+    Features stored as booleans in the database are always converted,
+    their other options can only be set globally.
+    """
+    if not isinstance(cfg, dict):
+        return cfg
+    normalized: Dict[Any, Any] = {}
+    for k, v in cfg.items():
+        if isinstance(v, dict) and (set(v.keys()) == {"enable"} or (is_boolean_feature(k) and "enable" in v)):
+            normalized[k] = v.get("enable")
+        else:
+            normalized[k] = v
+    return normalized
+
+
+class ConfigSnapshot:
+    """
+    A parsed config.yaml together with the tables derived from it
+
+    Group sections are keyed by their int chat ID and merged with the global
+    features ahead of time, so nothing has to be normalized on the hot path.
+    A snapshot is never modified, reloading builds a new one.
+    """
+    __slots__ = ('data', 'mtime', 'features', 'global_enabled', 'normalized_features', 'groups', 'normalized_groups',
+                 'merged_groups')
+
+    def __init__(self, data: Dict[Union[str, int], Any], mtime: Optional[float] = None):
+        self.data = data
+        self.mtime = mtime
+        self.features: Dict[str, Any] = data.get('features') or {}
+        self.global_enabled: Dict[str, bool] = {
+            feature: feature_config.get('enable', False)
+            for feature, feature_config in self.features.items() if isinstance(feature_config, dict)
+        }
+        self.normalized_features = _normalize_enabled_dicts(self.features)
+        # 群组的 chat_id 在 YAML 中可能写成数字也可能写成字符串，数字优先
+        self.groups: Dict[int, Dict[str, Any]] = {}
+        for key, value in sorted(data.items(), key=lambda item: isinstance(item[0], int)):
+            if isinstance(key, bool) or not isinstance(value, dict) or not value:
+                continue
+            if isinstance(key, int) or (isinstance(key, str) and key.lstrip('-').isdigit()):
+                self.groups[int(key)] = value
+        self.normalized_groups = {
+            chat_id: _normalize_enabled_dicts(group_config) for chat_id, group_config in self.groups.items()
+        }
+        self.merged_groups = {
+            chat_id: _fill_none(group_config, self.normalized_features)
+            for chat_id, group_config in self.normalized_groups.items()
+        }
+
+
+class FeatureContext:
+    """
+    A chat's resolved feature flags and feature configs
+
+    Built once per update by FeatureContextMiddleware so handlers don't have to
+    query the config for every feature they check.
+    """
+    __slots__ = ('chat_id', '_enabled', '_configs')
+
+    def __init__(self, chat_id: Optional[int], enabled: Dict[str, Any], configs: Dict[str, Any]):
+        self.chat_id = chat_id
+        self._enabled = enabled
+        self._configs = configs
+
+    def is_enabled(self, feature_name: str) -> bool:
+        """Check if a feature is enabled for this chat"""
+        return self._enabled.get(feature_name, False)
+
+    def get_config(self, feature_name: str) -> Dict[str, Any]:
+        """Get complete configuration for a feature in this chat"""
+        return self._configs.get(feature_name, {})
 
 
 class Config:
     def __init__(self, config_path: str = "config.yaml"):
         self.config_path = Path(config_path)
-        self.config_data = self._load_config()
+        self._snapshot = ConfigSnapshot(self._load_config(), self._get_mtime())
+        # chat_id -> 解析后的功能开关和配置
+        self._group_cache: Dict[int, Dict[str, Dict[str, Any]]] = {}
+        self._cache_generation = 0
+        add_invalidation_listener(self.invalidate_group_config)
+
+    @property
+    def config_data(self) -> Dict[Union[str, int], Any]:
+        """The parsed content of config.yaml"""
+        return self._snapshot.data
+
+    def _get_mtime(self) -> Optional[float]:
+        try:
+            return self.config_path.stat().st_mtime
+        except OSError:
+            return None
+
+    def _build_snapshot(self) -> ConfigSnapshot:
+        """Parse config.yaml into a new snapshot, raises if the file can't be parsed"""
+        mtime = self._get_mtime()
+        with open(self.config_path, 'r', encoding='utf-8') as file:
+            data = yaml.safe_load(file) or {}
+        if not isinstance(data, dict):
+            raise ValueError("配置文件的顶层必须是一个映射")
+        return ConfigSnapshot(data, mtime)
+
+    async def reload(self) -> bool:
+        """
+        Reload config.yaml if it has been modified since it was last loaded
+
+        The file is parsed in a worker thread and the new snapshot replaces the
+        old one in a single assignment, a file that fails to parse is ignored.
+
+        Returns:
+            bool: True if a new configuration was loaded
+        """
+        mtime = self._get_mtime()
+        if mtime is None or mtime == self._snapshot.mtime:
+            return False
+        try:
+            snapshot = await asyncio.to_thread(self._build_snapshot)
+        except (OSError, yaml.YAMLError, ValueError) as e:
+            logging.error(f"重新加载配置文件失败，继续使用旧的配置: {e}")
+            # 记下这个版本的修改时间，文件再次修改之前不再重试
+            self._snapshot = ConfigSnapshot(self._snapshot.data, mtime)
+            return False
+        self._snapshot = snapshot
+        self.invalidate_group_config()
+        logging.info("配置文件已重新加载")
+        return True
+
+    async def watch(self, interval: float = 5) -> None:
+        """
+        Poll config.yaml and reload it whenever it changes
+
+        Args:
+            interval: Seconds between two checks
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload()
+            except Exception:
+                logging.exception("检查配置文件更新时出错")
 
     def _load_config(self) ->  Dict[Union[str, int], Any]:
         """Load configuration from YAML file"""
@@ -62,9 +220,18 @@ class Config:
         Returns:
             bool: True if feature is enabled, False otherwise
         """
-        global_features = self.config_data.get('features', {})
-        feature_config = global_features.get(feature_name, {})
-        return feature_config.get('enable', False)
+        return self._snapshot.global_enabled.get(feature_name, False)
+
+    def get_file_group_config(self, chat_id: int) -> Dict[str, Any]:
+        """
+        Get the section of a group chat in config.yaml
+
+        Args:
+            chat_id: Chat ID of the group
+        Returns:
+            dict: Group configuration from config.yaml, empty if there is none
+        """
+        return self._snapshot.groups.get(chat_id, {})
 
     async def get_group_config(self, chat_id: int) -> None | dict[str, Any] | dict[Any, Any] | dict:
         """
@@ -76,62 +243,100 @@ class Config:
             dict: Group configuration
         """
 
-        def _fill_none(primary: Dict[str, Any], fallback: Dict[str, Any]) -> Dict[str, Any]:
-            if not isinstance(primary, dict):
-                return primary if primary is not None else fallback
-            result: Dict[str, Any] = {}
-            for k, v in primary.items():
-                fb = fallback.get(k) if isinstance(fallback, dict) else None
-                if isinstance(v, dict) and isinstance(fb, dict):
-                    result[k] = _fill_none(v, fb)
-                else:
-                    result[k] = v if v is not None else fb
-            # include keys only present in fallback
-            if isinstance(fallback, dict):
-                for k, v in fallback.items():
-                    if k not in result:
-                        result[k] = v
-            return result
-
-        def _normalize_enabled_dicts(cfg: Any) -> Any:
-            """
-            Convert dicts of the form {'enable': bool} into the bool value,
-            and recurse into nested dicts to normalize values.
-            """
-            if not isinstance(cfg, dict):
-                return cfg
-            normalized: Dict[Any, Any] = {}
-            for k, v in cfg.items():
-                if isinstance(v, dict) and set(v.keys()) == {"enable"}:
-                    normalized[k] = v.get("enable")
-                else:
-                    normalized[k] = v
-            return normalized
-
+        snapshot = self._snapshot
         try:
             db_config = await get_config(chat_id)
-            file_cfg = self.config_data.get(chat_id, {}) or self.config_data.get(str(chat_id),{})
-            file_cfg = _normalize_enabled_dicts(file_cfg)
             if not db_config:
-                if file_cfg:
-                    global_features = self.config_data.get('features', {})
-                    global_features = _normalize_enabled_dicts(global_features)
-                    return _fill_none(file_cfg, global_features)
                 # Fallback to global features if neither DB nor file has group config
-                return self.config_data.get('features', {})
-            else:
-                global_features = self.config_data.get('features', {})
-                global_features = _normalize_enabled_dicts(global_features)
-                if file_cfg:
-                    db_config = _fill_none(db_config, file_cfg)
-                    db_config = _fill_none(db_config, global_features)
-                    return db_config
-                else:
-                    db_config = _fill_none(db_config, global_features)
-            return db_config
+                return snapshot.merged_groups.get(chat_id, snapshot.normalized_features)
+            file_cfg = snapshot.normalized_groups.get(chat_id)
+            if file_cfg:
+                db_config = _fill_none(db_config, file_cfg)
+            return _fill_none(db_config, snapshot.normalized_features)
         except Exception as e:
             logging.warning(f"获取群组 {chat_id} 配置时出错",e)
 
+    def invalidate_group_config(self, chat_id: Optional[int] = None) -> None:
+        """
+        Drop the resolved configuration of a chat, or of every chat if chat_id is None
+
+        Args:
+            chat_id: Chat ID whose configuration changed (optional)
+        """
+        self._cache_generation += 1
+        if chat_id is None:
+            self._group_cache.clear()
+        else:
+            self._group_cache.pop(chat_id, None)
+
+    async def _resolve_group_features(self, chat_id: int) -> Dict[str, Dict[str, Any]]:
+        """
+        解析一个群组所有功能的开关和配置，结果缓存到群组配置变化为止
+
+        Returns:
+            dict: {'enabled': {功能: 是否开启}, 'config': {功能: 功能配置}}
+        """
+        resolved = self._group_cache.get(chat_id)
+        if resolved is not None:
+            return resolved
+        generation = self._cache_generation
+        cacheable = True
+        try:
+            db_config = await get_config(chat_id) or {}
+        except Exception:
+            logging.warning(f"从数据库获取群组 {chat_id} 配置时出错，使用文件配置作为后备")
+            db_config = {}
+            cacheable = False
+        snapshot = self._snapshot
+        group_config = snapshot.groups.get(chat_id, {})
+        global_features = snapshot.features
+        features = (set(global_features) | set(group_config) | set(db_config)) - {'id', 'chat_id'}
+
+        enabled: Dict[str, Any] = {}
+        feature_configs: Dict[str, Any] = {}
+        for feature in features:
+            db_value = db_config.get(feature)
+            file_value = group_config.get(feature)
+            # 数据库中的群组设置优先，其次是配置文件中的群组设置，最后是全局设置
+            if not snapshot.global_enabled.get(feature, False):
+                enabled[feature] = False
+            elif isinstance(db_value, bool):
+                enabled[feature] = db_value
+            elif isinstance(db_value, dict) and 'enable' in db_value:
+                enabled[feature] = db_value.get('enable')
+            elif isinstance(file_value, dict) and file_value.get('enable') is not None:
+                enabled[feature] = file_value.get('enable')
+            else:
+                enabled[feature] = True
+            if isinstance(db_value, dict):
+                feature_configs[feature] = db_value
+            elif feature in group_config:
+                feature_configs[feature] = file_value
+            else:
+                feature_configs[feature] = global_features.get(feature, {})
+
+        resolved = {'enabled': enabled, 'config': feature_configs}
+        # 解析期间配置发生了变化时不写入缓存，避免缓存旧的配置
+        if cacheable and generation == self._cache_generation:
+            self._group_cache[chat_id] = resolved
+        return resolved
+
+    async def get_feature_context(self, chat_id: Optional[int] = None) -> FeatureContext:
+        """
+        Get the resolved feature flags and configs of a chat
+
+        Args:
+            chat_id: Chat ID of the group (optional)
+
+        Returns:
+            FeatureContext: Feature flags and configs of the chat
+        """
+        if chat_id:
+            resolved = await self._resolve_group_features(chat_id)
+            return FeatureContext(chat_id, resolved['enabled'], resolved['config'])
+        # 没有群组时所有功能都视为关闭，配置使用全局设置
+        return FeatureContext(None, {}, self._snapshot.features)
+
     async def is_feature_enabled(self, feature_name: str, chat_id: Optional[int] = None) -> bool:
         """
         Check if a feature is enabled for a specific chat or globally
@@ -146,20 +351,9 @@ class Config:
         # 先检查全局设置
         if not self.is_global_feature_enabled(feature_name):
             return False
-        # Check group-specific settings first
         if chat_id:
-            try:
-                is_enabled = await get_config_value(chat_id, feature_name)
-                if isinstance(is_enabled, bool):
-                    return is_enabled
-                elif isinstance(is_enabled, dict) and 'enable' in is_enabled:
-                    return is_enabled.get('enable')
-            except Exception:
-                logging.warning(f"从数据库获取 {feature_name} 配置时出错，使用文件配置作为后备")
-            group_config = self.config_data.get(chat_id, {})
-            if feature_name in group_config and group_config[feature_name]['enable'] is not None:
-                return group_config[feature_name].get('enable')
-            return self.is_global_feature_enabled(feature_name)
+            resolved = await self._resolve_group_features(chat_id)
+            return resolved['enabled'].get(feature_name, False)
         return False
 
 
@@ -174,18 +368,12 @@ class Config:
         Returns:
             dict: Feature configuration
         """
-        # Check group-specific settings first
         if chat_id:
-            db_config = await get_config_value(chat_id, feature_name)
-            if isinstance(db_config, dict):
-                return db_config
-            group_config = self.config_data.get(chat_id, {})
-            if feature_name in group_config:
-                return group_config[feature_name]
+            resolved = await self._resolve_group_features(chat_id)
+            return resolved['config'].get(feature_name, {})
 
         # Fall back to global settings
-        global_features = self.config_data.get('features', {})
-        return global_features.get(feature_name, {})
+        return self._snapshot.features.get(feature_name, {})
 
 
 # Global config instance
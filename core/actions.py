@@ -2,12 +2,13 @@ import string
 
 from aiogram.types import Message
 
-from config import config
+from config import config, FeatureContext
 
 import logging
 
-async def handle_actions(message: Message) -> None:
-    if not await config.is_feature_enabled('actions', message.chat.id):
+async def handle_actions(message: Message, features: FeatureContext | None = None) -> None:
+    features = features or await config.get_feature_context(message.chat.id)
+    if not features.is_enabled('actions'):
         logging.debug(f"收到了命中 / 开头的的消息，但是 actions 功能未启用，跳过处理")
         return
     rawtext = message.text
@@ -30,10 +31,11 @@ async def handle_actions(message: Message) -> None:
     else:
         await message.reply(f"{from_user} {message.text.replace('/','')}了 {replied_user if message.reply_to_message and replied_user != from_user else '自己'}！",disable_web_page_preview=True)
 
-async def handle_reverse_actions(message: Message) -> None:
+async def handle_reverse_actions(message: Message, features: FeatureContext | None = None) -> None:
     from_user = message.from_user.mention_html(message.sender_chat.title) if message.sender_chat else message.from_user.mention_html()
     replied_user = message.reply_to_message.from_user.mention_html(message.reply_to_message.sender_chat.title) if message.reply_to_message and message.reply_to_message.sender_chat else message.reply_to_message.from_user.mention_html()
-    if not await config.is_feature_enabled('actions', message.chat.id):
+    features = features or await config.get_feature_context(message.chat.id)
+    if not features.is_enabled('actions'):
         logging.debug(f"收到了命中 \\ 开头的的消息，但是 actions 功能未启用，跳过处理")
         return
     logging.debug(f"收到了命中 \\ 开头的消息: {message.text}")
@@ -2,12 +2,14 @@ import logging
 
 from aiogram.types import Message
 
-from config import config
+from config import config, FeatureContext
+from adapters.db.anti_fake_users import ChannelWhiteListSnapshot
 
-async def handle_channel_manage_command(message: Message):
+async def handle_channel_manage_command(message: Message, features: FeatureContext | None = None):
     """封禁频道马甲命令"""
     chat_id = message.chat.id
-    if await config.is_feature_enabled('anti_anonymous', chat_id) is False:
+    features = features or await config.get_feature_context(chat_id)
+    if features.is_enabled('anti_anonymous') is False:
         return
     cargs = message.text.split(' ')
     if len(cargs) < 2:
@@ -80,17 +82,20 @@ async def handle_channel_manage_command(message: Message):
         else:
             await message.reply("用法： /fake auto_ban_channel [on|off]")
 
-async def handle_anonymous_channel_msgs(message: Message):
+async def handle_anonymous_channel_msgs(message: Message, features: FeatureContext | None = None,
+                                        channel_whitelist: ChannelWhiteListSnapshot | None = None):
     """处理来自匿名频道的消息"""
     chat_id = message.chat.id
-    if await config.is_feature_enabled('anti_anonymous', chat_id) is False:
+    features = features or await config.get_feature_context(chat_id)
+    if features.is_enabled('anti_anonymous') is False:
         return
     channel_id = message.sender_chat.id if message.sender_chat else None
     is_from_binded_channel = message.is_automatic_forward
     is_group_anonymous_admin = message.sender_chat and message.sender_chat.id == message.chat.id
-    from adapters.db.anti_fake_users import get_whitelist, get_ban_config
-    whitelist = await get_whitelist(chat_id)
-    also_ban = await get_ban_config(chat_id)
+    if channel_whitelist is None:
+        from adapters.db.anti_fake_users import get_whitelist_snapshot
+        channel_whitelist = await get_whitelist_snapshot(chat_id)
+    whitelist, also_ban = channel_whitelist.whitelist, channel_whitelist.also_ban
     if channel_id and channel_id not in whitelist and not is_from_binded_channel and not is_group_anonymous_admin:
         try:
             await message.delete()
@@ -1,6 +1,6 @@
 from aiogram.types import Message
 
-from config import config
+from config import config, FeatureContext
 
 
 def bitflip(text: str) -> str:
@@ -25,8 +25,9 @@ def bitflip(text: str) -> str:
     flipped_text = re.sub(r'\d*\.?\d+', replace_func, text)
     return flipped_text
 
-async def handle_bitflip_command(message: Message) -> None:
-    if not await config.is_feature_enabled('bitflip', message.chat.id):
+async def handle_bitflip_command(message: Message, features: FeatureContext | None = None) -> None:
+    features = features or await config.get_feature_context(message.chat.id)
+    if not features.is_enabled('bitflip'):
         return
     """获取回复的消息文本"""
     if not message.reply_to_message or not message.reply_to_message.text:
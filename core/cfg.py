@@ -3,6 +3,11 @@ from aiogram.types import Message
 from config import config
 from adapters.db.config import update_config_value
 
+async def _update_config(chat_id: int, feature: str, key: str | None, value: bool | str):
+    """写入群组配置并丢弃该群组已解析的配置缓存"""
+    await update_config_value(chat_id=chat_id, feature=feature, key=key, value=value)
+    config.invalidate_group_config(chat_id)
+
 async def handle_config_command(message: Message):
     if not message.chat.type in ('group', 'supergroup'):
         await message.reply("此命令只能在群组中使用")
@@ -39,20 +44,20 @@ async def handle_config_command(message: Message):
         return
     if key in group_config and isinstance(group_config[key], bool):
         if args[1].lower() in ['true', '1', 'yes', 'on']:
-            await update_config_value(chat_id=chat_id, feature=key, key=None,value=True)
+            await _update_config(chat_id=chat_id, feature=key, key=None,value=True)
             await message.reply(f"功能 {key} 已开启")
         elif args[1].lower() in ['false', '0', 'no', 'off']:
-            await update_config_value(chat_id=chat_id, feature=key, key=None,value=False)
+            await _update_config(chat_id=chat_id, feature=key, key=None,value=False)
             await message.reply(f"功能 {key} 已关闭")
     elif key in group_config and isinstance(group_config[key], dict):
         if args[1].lower() in ['true', '1', 'yes', 'on']:
-            await update_config_value(chat_id=chat_id, feature=key, key="enable", value=True)
+            await _update_config(chat_id=chat_id, feature=key, key="enable", value=True)
             await message.reply(f"功能 {key} 已开启")
         elif args[1].lower() in ['false', '0', 'no', 'off']:
-            await update_config_value(chat_id=chat_id, feature=key, key="enable", value=False)
+            await _update_config(chat_id=chat_id, feature=key, key="enable", value=False)
             await message.reply(f"功能 {key} 已关闭")
         elif args[1] in group_config[key].keys():
-            await update_config_value(chat_id=chat_id, feature=key, key=args[1], value=" ".join(args[2:]))
+            await _update_config(chat_id=chat_id, feature=key, key=args[1], value=" ".join(args[2:]))
             await message.reply(f"配置项 {key}.{args[1]} 已更新为 {' '.join(args[2:])}")
         elif args[1] not in group_config[key].keys():
             await message.reply(f"配置项 {key}.{args[1]} 不存在，请检查后重试")
@@ -4,13 +4,19 @@ import aiohttp
 import re
 import html
 import asyncio
+import codecs
 
 from urllib.parse import urlparse, parse_qsl, parse_qs, urlencode, urlunparse
 
 from aiogram.types import Message
 from nio import AsyncClient
 
-from config import config
+from adapters.db.links import get_cached_expansion, save_expansion
+from config import config, FeatureContext
+from helpers.clearurls import ClearURLsRules
+from helpers.host_limiter import HostLimiter, CircuitOpenError
+from helpers.removeparam import RemoveParamFilter
+from helpers.singleflight import single_flight
 
 whitelist_param_links = ['www.iesdouyin.com','item.taobao.com', 'detail.tmall.com', 'h5.m.goofish.com', 'music.163.com', 'y.music.163.com',
                                            'www.bilibili.com', 'm.bilibili.com', 'bilibili.com', 'mall.bilibili.com',
@@ -24,23 +30,94 @@ has_self_redirection_links = ['www.cnbeta.com.tw','m.cnbeta.com.tw','www.landian
 has_better_alternative_links = ['www.iesdouyin.com','bilibili.com', 'm.bilibili.com', 'youtube.com','youtu.be','m.youtube.com','x.com', 'twitter.com']
 
 # Load ClearURLs rules from JSON file
-with open('assets/clearurls.json', 'r', encoding='utf-8') as f:
-    import json
-    clearurls_rules = json.load(f)
+clearurls_rules = ClearURLsRules.load('assets/clearurls.json')
+# LegitimateURLShortener 中的 $removeparam 规则，编译后的结果缓存在 assets/LegitimateURLShortener.txt.cache
+removeparam_filter = RemoveParamFilter.load('assets/LegitimateURLShortener.txt')
 
+# 短链接展开结果的缓存时间，单位为秒，可以在配置文件的 link_expansion 中修改
+DEFAULT_EXPANSION_TTL = 86400
+# 没有跳转的链接
+DEFAULT_NEGATIVE_TTL = 3600
+DEFAULT_HOST_TTLS = {'b23.tv': 604800, 'share.google': 604800, 'tb.cn': 86400}
+# 展开短链接时最多读取的响应内容长度，以及每个请求的总时间限制
+DEFAULT_MAX_BODY_BYTES = 65536
+DEFAULT_REQUEST_TIMEOUT = 10
+# 查找跳转地址时，新读取的内容连同前面这么多字符一起查找，匹配可能跨越两个数据块
+MATCH_OVERLAP = 4096
+
+# 每个短链接主机的并发数、超时和熔断，修改配置后需要重启
+_expansion_settings = config.get_config_value('link_expansion', {}) or {}
+link_limiter = HostLimiter(
+    max_concurrency=_expansion_settings.get('max_concurrency_per_host', 4),
+    min_timeout=_expansion_settings.get('min_timeout', 2),
+    max_timeout=_expansion_settings.get('request_timeout', DEFAULT_REQUEST_TIMEOUT),
+    failure_threshold=_expansion_settings.get('failure_threshold', 5),
+    cooldown=_expansion_settings.get('cooldown', 60),
+)
+
+TB_URL_PATTERN = re.compile(r"var url = ['\"]([^'\"]+)['\"]")
+META_REFRESH_PATTERN = re.compile(r'<meta http-equiv=[\"\']refresh[\"\'] content=[\"\']\d+\s?;\s?url=([^\"\']+)[\"\']', re.IGNORECASE)
+
+def expansion_ttl(url, expanded_url):
+    """ 短链接展开结果的缓存时间，按域名后缀匹配 host_ttl，没有跳转的链接最多缓存 negative_ttl """
+    settings = config.get_config_value('link_expansion', {}) or {}
+    ttl = settings.get('ttl', DEFAULT_EXPANSION_TTL)
+    host_ttls = {**DEFAULT_HOST_TTLS, **(settings.get('host_ttl') or {})}
+    labels = (urlparse(url).hostname or '').split('.')
+    for i in range(len(labels)):
+        host_ttl = host_ttls.get('.'.join(labels[i:]))
+        if host_ttl is not None:
+            ttl = host_ttl
+            break
+    if expanded_url == url:
+        # 域名设置为 0 时没有跳转的结果同样不缓存
+        return min(ttl, settings.get('negative_ttl', DEFAULT_NEGATIVE_TTL))
+    return ttl
+
+@single_flight()
 async def extend_short_urls(url):
-    """ 扩展短链接 """
-    async with aiohttp.ClientSession() as session:
+    """ 扩展短链接，展开结果会缓存在内存和数据库中，同时展开同一个链接时只会请求一次 """
+    cached_url = await get_cached_expansion(url)
+    if cached_url is not None:
+        return cached_url
+    try:
+        async with link_limiter.request(urlparse(url).hostname or '') as timeout:
+            expanded_url = await _resolve_short_url(url, timeout)
+    except (CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        # 主机无法访问时不展开链接，只清理本地能识别的跟踪参数，结果也不缓存
+        logging.info(f"展开链接 {url} 失败，跳过展开: {e!r}")
+        return url
+    ttl = expansion_ttl(url, expanded_url)
+    if ttl > 0:
+        await save_expansion(url, expanded_url, ttl)
+    return expanded_url
+
+async def _resolve_short_url(url, timeout=DEFAULT_REQUEST_TIMEOUT):
+    """ 通过网络请求扩展短链接，只在需要时读取有限长度的响应内容 """
+    settings = config.get_config_value('link_expansion', {}) or {}
+    max_body_bytes = settings.get('max_body_bytes', DEFAULT_MAX_BODY_BYTES)
+    timeout = aiohttp.ClientTimeout(total=timeout)
+    is_tb = 'tb.cn' in urlparse(url).hostname
+    patterns = (TB_URL_PATTERN, META_REFRESH_PATTERN) if is_tb else (META_REFRESH_PATTERN,)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
         async with session.get(url,allow_redirects=False) as r:
-            html_content = await r.text()
-            if 'tb.cn' in urlparse(url).hostname:
+            html_content = None
+
+            async def get_html_content():
+                # 响应内容只在需要时读取一次，只读取状态码和响应头就足够的情况下不会下载页面
+                nonlocal html_content
+                if html_content is None:
+                    html_content = await read_html(r, patterns, max_body_bytes)
+                return html_content
+
+            if is_tb:
                 # 淘宝短链接特殊处理
-                decoded_url = extract_tb_url_from_html(html_content)
+                decoded_url = extract_tb_url_from_html(await get_html_content())
                 if decoded_url:
                     return decoded_url
-            if r.status == 200 and 'meta http-equiv' in html_content:
+            if r.status == 200:
                 # 处理 meta refresh 重定向
-                meta_refresh_url = check_meta_refresh(html_content)
+                meta_refresh_url = check_meta_refresh(await get_html_content())
                 if meta_refresh_url:
                     return meta_refresh_url
             if r.status in [301, 302, 304, 307, 308] and 'Location' in r.headers:
@@ -53,11 +130,10 @@ async def extend_short_urls(url):
                                 return str(r_all_direct.url)
                     # 如果 Location 只是为路径末尾添加了 / 或者去除 / 也直接返回原链接
                     if (redirect_url.endswith('/') and url == redirect_url[:-1]) or (url.endswith('/') and url[:-1] == redirect_url):
-                        if 'meta http-equiv' in html_content:
-                            # 处理 meta refresh 重定向
-                            meta_refresh_url = check_meta_refresh(html_content)
-                            if meta_refresh_url:
-                                return meta_refresh_url
+                        # 处理 meta refresh 重定向
+                        meta_refresh_url = check_meta_refresh(await get_html_content())
+                        if meta_refresh_url:
+                            return meta_refresh_url
                         return url
                     return redirect_url
                 else:
@@ -66,11 +142,10 @@ async def extend_short_urls(url):
                     full_redirect_url = urlparse(url)._replace(path=redirect_url).geturl()
                     # 如果只是为路径末尾添加了 / 或者去除 / 也直接返回原链接
                     if (full_redirect_url.endswith('/') and url == full_redirect_url[:-1]) or (url.endswith('/') and url[:-1] == full_redirect_url):
-                        if 'meta http-equiv' in html_content:
-                            # 处理 meta refresh 重定向
-                            meta_refresh_url = check_meta_refresh(html_content)
-                            if meta_refresh_url:
-                                return meta_refresh_url
+                        # 处理 meta refresh 重定向
+                        meta_refresh_url = check_meta_refresh(await get_html_content())
+                        if meta_refresh_url:
+                            return meta_refresh_url
                         return url
                     # 其它情况下，直接返回完整的、正确的链接
                     return full_redirect_url
@@ -92,10 +167,39 @@ async def extend_short_urls(url):
                             return urlparse(url)._replace(path=fixed_redirect_url).geturl()
     return url
 
+async def read_html(response, patterns, max_bytes):
+    """ 读取最多 max_bytes 字节的 HTML 响应内容，找到任意一个 pattern 后立即停止读取 """
+    content_type = response.headers.get('Content-Type')
+    if content_type and 'html' not in content_type:
+        return ''
+    try:
+        encoding = codecs.lookup(response.charset or 'utf-8').name
+    except LookupError:
+        encoding = 'utf-8'
+    # 逐块解码，被截断在块末尾的多字节字符留到下一块再解码
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    parts = []
+    tail = ''
+    size = 0
+    async for chunk in response.content.iter_chunked(8192):
+        chunk = chunk[:max_bytes - size]
+        size += len(chunk)
+        text = decoder.decode(chunk, final=size >= max_bytes)
+        parts.append(text)
+        # 之前的内容已经查找过，只需要查找新的内容和与之相接的一小段
+        window = tail + text
+        if size >= max_bytes or any(pattern.search(window) for pattern in patterns):
+            # 提前结束时剩余的内容不再读取，直接关闭连接
+            response.close()
+            break
+        tail = window[-MATCH_OVERLAP:]
+    else:
+        parts.append(decoder.decode(b'', final=True))
+    return ''.join(parts)
+
 def extract_tb_url_from_html(html_content):
     # 使用正则表达式匹配 var url = '...' 的模式
-    pattern = r"var url = ['\"]([^'\"]+)['\"]"
-    match = re.search(pattern, html_content)
+    match = TB_URL_PATTERN.search(html_content)
 
     if match:
         url = match.group(1)
@@ -106,8 +210,7 @@ def extract_tb_url_from_html(html_content):
 
 def check_meta_refresh(html_content):
     # 使用正则表达式匹配 <meta http-equiv="refresh" content="0;url=..."> 的模式
-    pattern = r'<meta http-equiv=[\"\']refresh[\"\'] content=[\"\']\d+\s?;\s?url=([^\"\']+)[\"\']'
-    match = re.search(pattern, html_content, re.IGNORECASE)
+    match = META_REFRESH_PATTERN.search(html_content)
 
     if match:
         url = match.group(1)
@@ -116,34 +219,20 @@ def check_meta_refresh(html_content):
         return decoded_url
     return None
 
-# Assume clearurls_rules is a dict loaded from the JSON
-def remove_tracking_params(url, rules):
+def remove_tracking_params(url, rules: ClearURLsRules, param_filter: RemoveParamFilter = removeparam_filter):
     parsed = urlparse(url)
-    domain = parsed.netloc.lower()
-    path = parsed.path
-    matched_rule = None
-
-    # Find matching rule by urlPattern
-    for site, rule in rules['providers'].items():
-        if re.match(rule['urlPattern'], url):
-            matched_rule = rule
-            break
-
-    if not matched_rule or not matched_rule['rules']:
+    if not parsed.query:
         return url
 
+    # 只检查和域名相关的 provider，每个 provider 的参数规则已经合并为一个正则
+    query = parse_qsl(parsed.query, keep_blank_values=True)
+    tracking_params = rules.tracking_params(url, parsed.hostname, (k for k, v in query))
+    host_filter = param_filter.for_host(parsed.hostname)
+
     # Remove tracking params
-    query = parse_qsl(parsed.query, keep_blank_values=False)
-    filtered_query = [
-        (k, v) for k, v in query
-        if not any(re.fullmatch(param, k) for param in matched_rule['rules'])
-    ]
-
-    # Remove UTM parameters
-    utm_params = ['utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content']
-    for param in utm_params:
-        if param in filtered_query:
-            filtered_query.pop(param, None)
+    filtered_query = [(k, v) for k, v in query if k not in tracking_params and not host_filter.matches(k, v)]
+    if len(filtered_query) == len(query):
+        return url
 
     new_query = urlencode(filtered_query)
 
@@ -289,6 +378,8 @@ def transform_into_fixed_url(url):
         return urlunparse(parsed_url._replace(netloc='www.youtube.com'))
     return url
 
+# 同一个链接被同时转发到多个群组时只处理一次
+@single_flight()
 async def process_url(url):
     logging.debug('发现链接，正在尝试清理')
     if urlparse(url).hostname in has_self_redirection_links and not urlparse(url).query:
@@ -335,7 +426,8 @@ async def process_url(url):
 async def clean_link_in_text(text):
     # URL regex pattern
     url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-    urls = re.findall(url_pattern, text)
+    # 同一条消息中重复的链接只处理一次
+    urls = list(dict.fromkeys(re.findall(url_pattern, text)))
     if not urls:
         return None
     final_urls = await asyncio.gather(*[process_url(url) for url in urls])
@@ -343,8 +435,9 @@ async def clean_link_in_text(text):
     final_urls = [url for url in final_urls if url is not None]
     return final_urls
 
-async def handle_tg_links(message: Message):
-    if not await config.is_feature_enabled('link', message.chat.id):
+async def handle_tg_links(message: Message, features: FeatureContext | None = None):
+    features = features or await config.get_feature_context(message.chat.id)
+    if not features.is_enabled('link'):
         return
 
     text = message.text or message.caption
@@ -1,10 +1,22 @@
+import logging
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Callable, Dict, Awaitable, Any
 
 from unidecode import unidecode
 
-from aiogram import BaseMiddleware
+from aiogram import BaseMiddleware, Bot, html
+from aiogram.enums import ParseMode
 from aiogram.types import Message
 
+from helpers.confusables import SkeletonIndex, SkeletonMatch
+from helpers.singleflight import single_flight
+
+# 群组管理员名单的缓存时间（秒）
+ADMIN_CACHE_TTL = 600
+# 记住最近提醒过的用户名称，同一个用户在名称不变时只提醒一次
+MAX_REPORTED_NAMES = 4096
+
 class AntiFakeChannelUsersMiddleware(BaseMiddleware):
     def __init__(self) -> None:
         self.counter = 0
@@ -17,32 +29,83 @@ class AntiFakeChannelUsersMiddleware(BaseMiddleware):
     ) -> Any:
         linked_info = {}
         if event.chat.type == 'supergroup':
-            from adapters.db.anti_fake_users import get_linked_channel_info, update_linked_channel_info
-            linked_info = await get_linked_channel_info(event.chat.id)
+            from adapters.db.anti_fake_users import get_whitelist_snapshot, update_linked_channel_info
+            snapshot = await get_whitelist_snapshot(event.chat.id)
+            # 白名单快照交给后续的处理器继续使用，不再重复查询
+            data['channel_whitelist'] = snapshot
+            linked_info = snapshot.linked_info
             if event.sender_chat and event.is_automatic_forward:
-                # 检测绑定频道消息是否有变动
-                if linked_info['id'] != event.sender_chat.id or linked_info['fullname'] != event.sender_chat.full_name or linked_info['username'] != (event.sender_chat.username or ""):
-                    fullname = normalize_channel_names(event.sender_chat.full_name)
-                    username = event.sender_chat.username or ""
-                    await update_linked_channel_info(event.chat.id, event.sender_chat.id, fullname, username)
-            if not event.sender_chat or (not event.is_automatic_forward and not event.from_user.is_bot):
-                # Message is sent by a linked channel
-                normalized_fullname = normalize_channel_names(event.from_user.full_name)
-                if normalized_fullname == linked_info['fullname']:
-                    await handle_fake_channel_message(event)
+                # 检测绑定频道消息是否有变动，数据库中同时保存规范化之后的频道名称和原样的名称
+                raw_fullname = event.sender_chat.full_name
+                fullname = normalize_channel_names(raw_fullname)
+                username = event.sender_chat.username or ""
+                if (linked_info['id'] != event.sender_chat.id or linked_info['fullname'] != fullname
+                        or linked_info['username'] != username or linked_info.get('raw_fullname') != raw_fullname):
+                    await update_linked_channel_info(event.chat.id, event.sender_chat.id, fullname, username, raw_fullname)
+            if event.from_user and (not event.sender_chat or (not event.is_automatic_forward and not event.from_user.is_bot)):
+                # 检查发送者是否在模仿绑定频道或者管理员的名称
+                admin_ids, protected_names = await get_protected_names(event.bot, event.chat.id, linked_info)
+                if event.from_user.id not in admin_ids:
+                    fullname = event.from_user.full_name
+                    if linked_info.get('fullname') and normalize_channel_names(fullname) == linked_info['fullname']:
+                        # 与绑定频道同名
+                        await handle_fake_channel_message(event)
+                    else:
+                        # 只有用形近字符伪造的名称才直接封禁，同名或者只相差一个字符的交给管理员判断
+                        match = protected_names.find(fullname, exclude=event.from_user.id)
+                        if match is not None and match.spoofed:
+                            await handle_fake_channel_message(event)
+                        elif match is not None:
+                            await report_similar_name(event, match, linked_info)
         return await handler(event, data)
 
+@single_flight(ttl=ADMIN_CACHE_TTL)
+async def _get_admins(bot: Bot, chat_id: int) -> tuple[tuple[int, str], ...]:
+    """获取群组中非 bot 管理员的 (用户 ID, 名称)"""
+    try:
+        admins = await bot.get_chat_administrators(chat_id)
+    except Exception as e:
+        logging.warning(f"获取群组 {chat_id} 的管理员列表失败: {e}")
+        return ()
+    return tuple((member.user.id, member.user.full_name) for member in admins if not member.user.is_bot)
+
+# chat_id -> ((绑定频道 ID, 绑定频道名称, 管理员列表), 管理员 ID, 受保护名称的索引)
+_protected_names: dict[int, tuple[tuple, frozenset[int], SkeletonIndex]] = {}
+
+async def get_protected_names(bot: Bot, chat_id: int, linked_info: dict) -> tuple[frozenset[int], SkeletonIndex]:
+    """获取群组的管理员 ID 以及绑定频道和管理员名称的索引，频道或管理员变化时重新建立索引"""
+    admins = await _get_admins(bot, chat_id)
+    # 频道和管理员的名称都使用原样的名称，才能识别非拉丁字母名称的形近字符伪造，并区分伪造和普通的同名；
+    # 更新之前保存的频道信息没有原样的名称，在频道下一次转发消息之前使用规范化之后的名称
+    channel_name = linked_info.get('raw_fullname') or linked_info.get('fullname')
+    source = (linked_info.get('id'), channel_name, admins)
+    cached = _protected_names.get(chat_id)
+    if cached and cached[0][:2] == source[:2] and cached[0][2] is admins:
+        return cached[1], cached[2]
+    names = [(name, user_id) for user_id, name in admins]
+    if channel_name:
+        names.append((channel_name, linked_info.get('id')))
+    admin_ids = frozenset(user_id for user_id, _ in admins)
+    index = SkeletonIndex(names)
+    _protected_names[chat_id] = (source, admin_ids, index)
+    return admin_ids, index
+
+class _NormalizeTable(dict):
+    """str.translate 使用的转换表，第一次遇到某个字符时才计算并记住它的转换结果"""
+    def __missing__(self, codepoint: int) -> str:
+        char = chr(codepoint)
+        # 中日韩统一表意文字和 ASCII 字符保持原样，其他字符转写为 ASCII
+        value = char if '\u4e00' <= char <= '\u9fff' or char.isascii() else unidecode(char)
+        self[codepoint] = value
+        return value
+
+_normalize_table = _NormalizeTable()
+
+@lru_cache(maxsize=4096)
 def normalize_channel_names(name: str) -> str:
-    def is_cjk(character):
-        # 判断字符是否为中日韩统一表意文字
-        return '\u4e00' <= character <= '\u9fff'
-    normalized = []
-    for char in name:
-        if is_cjk(char) or char.isascii():
-            normalized.append(char)
-        else:
-            normalized.append(unidecode(char))
-    return ''.join(normalized)
+    if name.isascii():
+        return name
+    return name.translate(_normalize_table)
 
 async def handle_fake_channel_message(message: Message) -> None:
     """处理疑似伪装频道用户的消息"""
@@ -50,4 +113,27 @@ async def handle_fake_channel_message(message: Message) -> None:
         await message.bot.ban_chat_member(chat_id=message.chat.id, user_id=message.from_user.id)
         await message.delete()
     except Exception as err:
-        await message.reply(f"发现疑似伪装频道的用户，但删除并封禁操作失败，请检查 bot 是否有相关权限。\n{str(err)}")
\ No newline at end of file
+        await message.reply(f"发现疑似伪装频道的用户，但删除并封禁操作失败，请检查 bot 是否有相关权限。\n{str(err)}")
+# (chat_id, 用户 ID, 用户名称)，按提醒的先后顺序排列
+_reported_names: OrderedDict[tuple[int, int, str], None] = OrderedDict()
+
+async def report_similar_name(message: Message, match: SkeletonMatch, linked_info: dict) -> None:
+    """提醒管理员有用户的名称与管理员或绑定频道相同或相似，由管理员决定是否处理"""
+    key = (message.chat.id, message.from_user.id, message.from_user.full_name)
+    if key in _reported_names:
+        return
+    _reported_names[key] = None
+    while len(_reported_names) > MAX_REPORTED_NAMES:
+        _reported_names.popitem(last=False)
+    target = "绑定频道" if match.owner == linked_info.get('id') else "管理员"
+    relation = "相同" if match.exact else "相似"
+    admins = await _get_admins(message.bot, message.chat.id)
+    mentions = " ".join(html.link(html.quote(name), f"tg://user?id={user_id}") for user_id, name in admins)
+    try:
+        await message.reply(
+            f"⚠️ 用户 {html.quote(message.from_user.full_name)} 的名称与{target} {html.quote(match.name)} {relation}，"
+            f"可能是在冒充，请管理员确认。\n{mentions}",
+            parse_mode=ParseMode.HTML
+        )
+    except Exception as e:
+        logging.warning(f"提醒管理员疑似冒充的用户失败: {e}")
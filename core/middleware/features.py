@@ -0,0 +1,20 @@
+from typing import Callable, Dict, Awaitable, Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from config import config
+
+
+class FeatureContextMiddleware(BaseMiddleware):
+    """每个更新只解析一次所在群组的功能开关和配置，放到 data['features'] 中供后续中间件和处理器使用"""
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        # event_chat 由 aiogram 自带的 UserContextMiddleware 提前写入
+        chat = data.get('event_chat')
+        data['features'] = await config.get_feature_context(chat.id if chat else None)
+        return await handler(event, data)
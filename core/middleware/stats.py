@@ -2,55 +2,67 @@ from aiogram import BaseMiddleware
 from aiogram.types import Message
 from typing import Callable, Dict, Any, Awaitable
 
-from datetime import datetime, timedelta
-from adapters.db.stats import update_group_stats, update_user_stats, get_24h_message_stats, update_24h_message
-from config import config
-
+import logging
 
-async def cleanup_old_messages(chat_id: int):
-    """清理超过24小时的消息记录"""
-    messages_24h = await get_24h_message_stats(chat_id)
-    if not messages_24h:
-        return
-
-    messages = messages_24h.get('messages')
-    if not messages:
-        # ensure structure exists for downstream code
-        messages_24h.setdefault('messages', [])
-        messages_24h.setdefault('messages_24h', {})
-        messages_24h.setdefault('active_users', {})
-        return
-
-    cutoff_time = datetime.now() - timedelta(hours=24)
-    cleaned_messages = []
-    for msg in messages:
-        ts = msg.get('timestamp')
-        if ts is None:
-            continue
-        try:
-            msg_time = datetime.fromisoformat(ts) if isinstance(ts, str) else datetime.fromtimestamp(float(ts))
-        except Exception:
-            # Skip messages with invalid timestamp formats
-            continue
-        if msg_time > cutoff_time:
-            cleaned_messages.append(msg)
-
-    messages_24h['messages'] = cleaned_messages
-
-    # Update message count safely
-    messages_24h.setdefault('messages_24h', {})
-    messages_24h['messages_24h']['message_count'] = len(cleaned_messages)
-
-    # Recompute active users (count messages per user), skip entries without user_id
-    active_users_dict = {}
-    for msg in cleaned_messages:
-        user_id = msg.get('user_id')
-        if user_id is None:
-            continue
-        active_users_dict[user_id] = active_users_dict.get(user_id, 0) + 1
-    messages_24h['active_users'] = active_users_dict
-    # 保存更新后的24小时消息统计到数据库
-    await update_24h_message(chat_id, messages_24h)
+from adapters.db.stats import USER_COUNTERS
+from adapters.db.stats_buffer import StatsBuffer
+from config import config
+from helpers.aho_corasick import KeywordAutomaton
+
+# 默认的计数规则，可以在 config.yaml 的 features.stats.counters 或者群组配置中覆盖
+DEFAULT_COUNTER_RULES = {
+    'xm_count': {'keywords': ['xm', 'xmsl', '羡慕', '羡慕死了'], 'stickers': ['AQADhhcAAs1rgFVy']},
+    'wocai_count': {'keywords': ['我菜'], 'stickers': ['AQAD6AUAAgGeUVZy']},
+}
+
+# 超出 24 小时窗口的活跃度桶会在批量写入时整桶删除
+stats_buffer = StatsBuffer(
+    flush_interval=config.get_config_value('features.stats.flush_interval', 5),
+    max_events=config.get_config_value('features.stats.flush_max_events', 200),
+)
+
+
+class CounterRules:
+    """关键词/贴纸到计数器的映射，关键词编译为一个自动机，一次扫描即可得到全部命中的计数器"""
+
+    def __init__(self, rules: dict):
+        keywords: dict[str, set[str]] = {}
+        self.stickers: dict[str, set[str]] = {}
+        for counter, rule in rules.items():
+            if counter not in USER_COUNTERS or counter == 'message_count':
+                logging.warning(f"未知的统计计数器 {counter}，已忽略")
+                continue
+            for keyword in rule.get('keywords') or []:
+                keywords.setdefault(str(keyword), set()).add(counter)
+            for sticker in rule.get('stickers') or []:
+                self.stickers.setdefault(str(sticker), set()).add(counter)
+        self.automaton = KeywordAutomaton(keywords)
+
+    def match(self, message: Message) -> tuple[str, ...]:
+        """返回消息命中的计数器，每个计数器每条消息最多计一次"""
+        counters = set()
+        if message.text:
+            counters |= self.automaton.match(message.text)
+        if message.sticker:
+            counters |= self.stickers.get(message.sticker.file_unique_id, set())
+        return tuple(counters)
+
+# chat_id -> (规则配置, 编译好的规则)，配置对象变化时重新编译
+_counter_rules_cache: dict[int, tuple[dict, CounterRules]] = {}
+
+def get_counter_rules(chat_id: int) -> CounterRules:
+    """获取群组的计数规则，群组配置优先于全局配置"""
+    group_cfg = config.get_file_group_config(chat_id)
+    stats_cfg = group_cfg.get('stats')
+    rules = stats_cfg.get('counters') if isinstance(stats_cfg, dict) else None
+    if rules is None:
+        rules = config.get_config_value('features.stats.counters', DEFAULT_COUNTER_RULES)
+    cached = _counter_rules_cache.get(chat_id)
+    if cached and cached[0] is rules:
+        return cached[1]
+    compiled = CounterRules(rules)
+    _counter_rules_cache[chat_id] = (rules, compiled)
+    return compiled
 
 
 class MessageStatsMiddleware(BaseMiddleware):
@@ -61,7 +73,8 @@ class MessageStatsMiddleware(BaseMiddleware):
         data: Dict[str, Any]
     ) -> Any:
         # 只统计群组消息
-        if not await config.is_feature_enabled('stats', event.chat.id):
+        features = data.get('features') or await config.get_feature_context(event.chat.id)
+        if not features.is_enabled('stats'):
             return await handler(event, data)
         if event.chat.type in ['group', 'supergroup']:
             chat_id = event.chat.id
@@ -78,25 +91,10 @@ class MessageStatsMiddleware(BaseMiddleware):
             elif event.from_user:
                 name = event.from_user.full_name
 
-            # 更新统计
-            await update_group_stats(chat_id, user_id)
-            # 更新活跃用户统计
-            await update_user_stats(chat_id, user_id, username, name, attr=None)
-
-            # 羡慕、我菜统计
-            if event.text and any(keyword in event.text for keyword in ['xm','xmsl','羡慕','羡慕死了']):
-                await update_user_stats(chat_id, user_id, username, name, attr='xm_count')
+            # 羡慕、我菜等关键词统计
+            counters = get_counter_rules(chat_id).match(event)
 
-            if event.sticker and event.sticker.file_unique_id in ['AQADhhcAAs1rgFVy']:
-                await update_user_stats(chat_id, user_id, username, name, attr='xm_count')
-
-            if event.text and '我菜' in event.text:
-                await update_user_stats(chat_id, user_id, username, name, attr='wocai_count')
-            if event.sticker and event.sticker.file_unique_id in ['AQAD6AUAAgGeUVZy']:
-                await update_user_stats(chat_id, user_id, username, name, attr='wocai_count')
-
-            # 清理超过24小时的记录
-            await cleanup_old_messages(chat_id)
+            # 更新统计，实际写入数据库由 stats_buffer 定期批量完成
+            stats_buffer.record_message(chat_id, user_id, username, name, event.chat.title, counters)
 
         return await handler(event, data)
-
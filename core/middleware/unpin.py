@@ -1,6 +1,6 @@
 import logging
 from typing import Callable, Dict, Awaitable, Any
-from config import config
+from config import config, FeatureContext
 from aiogram import BaseMiddleware
 from aiogram.types import Message
 
@@ -18,16 +18,17 @@ class UnpinChannelMsgMiddleware(BaseMiddleware):
         if event.chat.type == 'supergroup':
             if event.sender_chat and event.sender_chat.type == 'channel' and event.is_automatic_forward:
                 # Message is sent by a linked channel
-                await handle_unpin_channel_message(event)
+                await handle_unpin_channel_message(event, data.get('features'))
         return await handler(event, data)
 
-async def handle_unpin_channel_message(message: Message):
+async def handle_unpin_channel_message(message: Message, features: FeatureContext | None = None):
     """Handle unpinning messages from linked channels without a specific hashtag"""
-    if not await config.is_feature_enabled('unpin', message.chat.id):
+    features = features or await config.get_feature_context(message.chat.id)
+    if not features.is_enabled('unpin'):
         logging.debug('发现了频道试图置顶消息，但未启用 unpin 功能，跳过处理')
         return
     try:
-        cfg = await config.get_feature_config('unpin', message.chat.id)
+        cfg = features.get_config('unpin')
         regex_pattern = cfg.get('regex') if isinstance(cfg, dict) else None
         # If a regex pattern exists, check if the message matches
         if regex_pattern:
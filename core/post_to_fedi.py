@@ -10,7 +10,7 @@ from aiogram import Router
 
 from adapters.db.fedi import get_fedi_user_cred, update_fedi_user_cred, get_fedi_client_info, update_fedi_client_info, \
     get_fedi_user_instance_domains, fedi_instance_is_misskey
-from config import config
+from config import config, FeatureContext
 from mastodon import Mastodon
 
 router = Router()
@@ -65,11 +65,12 @@ async def handle_token(instance, mastodon, message: Message):
     # 保存用户凭据
     await update_fedi_user_cred(instance, message.from_user.id, access_token)
 
-async def handle_auth(message: Message, state: FSMContext):
+async def handle_auth(message: Message, state: FSMContext, features: FeatureContext | None = None):
     """
     处理身份验证
     """
-    if not await config.is_feature_enabled('fedi', message.chat.id):
+    features = features or await config.get_feature_context(message.chat.id)
+    if not features.is_enabled('fedi'):
         return
     if not message.chat.type == 'private':
         await message.reply('请在私聊中使用此命令')
@@ -146,11 +147,12 @@ async def handle_token_reply(message: Message, state: FSMContext):
     # 清除状态
     await state.clear()
 
-async def handle_post_to_fedi(message: Message):
+async def handle_post_to_fedi(message: Message, features: FeatureContext | None = None):
     """
     处理发布到联邦网络的消息
     """
-    if not await config.is_feature_enabled('fedi', message.chat.id):
+    features = features or await config.get_feature_context(message.chat.id)
+    if not features.is_enabled('fedi'):
         return
     if not message.reply_to_message:
         await message.reply('请回复要发布的消息')
@@ -2,12 +2,13 @@ from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message
 from emoji import is_emoji
 
-from config import config
+from config import config, FeatureContext
 
 
-async def handle_promote_command(message: Message) -> None:
+async def handle_promote_command(message: Message, features: FeatureContext | None = None) -> None:
     title = message.text.replace('/t', '').strip()
-    if not await config.is_feature_enabled('promote', message.chat.id):
+    features = features or await config.get_feature_context(message.chat.id)
+    if not features.is_enabled('promote'):
         return
     if message.chat.type not in ['group', 'supergroup']:
         return
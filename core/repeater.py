@@ -1,64 +1,120 @@
 import aiogram.types
-from collections import defaultdict
+from collections import OrderedDict
+from hashlib import blake2b
 import time
+import unicodedata
 
-from config import config
+from adapters.state.core import StateBackend
+from config import config, FeatureContext
+
+
+# 共享状态被并发修改时重试的次数
+SHARED_UPDATE_ATTEMPTS = 5
+
+
+class _ChatState:
+    """一个群组的复读状态：上一条消息、连续出现的次数、是否已经复读过"""
+    __slots__ = ('last_key', 'count', 'repeated', 'last_seen')
+
+    def __init__(self, key: int, now: float):
+        self.last_key = key
+        self.count = 1
+        self.repeated = False
+        self.last_seen = now
+
+
+def content_key(message: aiogram.types.Message) -> int | None:
+    """
+    消息内容的 64 位指纹，不支持复读的消息返回 None
+
+    文本按 NFKC 规范化并合并空白后计算哈希；贴纸和图片使用 file_unique_id，
+    它在不同 bot 和重复上传之间保持不变，而 file_id 不是
+    """
+    if message.text:
+        data = b't' + ' '.join(unicodedata.normalize('NFKC', message.text).split()).encode()
+    elif message.sticker:
+        data = b's' + message.sticker.file_unique_id.encode()
+    elif message.photo:
+        data = b'p' + message.photo[-1].file_unique_id.encode()
+    else:
+        return None
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), 'big')
 
 
 class MessageRepeater:
-    def __init__(self, message_expiry_seconds=3600):  # 1 hour default
-        self.message_counts = defaultdict(lambda: defaultdict(int))
-        self.repeated_messages = defaultdict(set)
-        self.message_timestamps = defaultdict(lambda: defaultdict(float))
-        self.last_messages = defaultdict(str)  # Track last message in each chat
+    def __init__(self, message_expiry_seconds=3600, max_chats=10000, state: StateBackend | None = None):  # 1 hour default
+        # chat_id -> 复读状态，按最后活跃时间排序，最久没有消息的群组在最前面
+        self.chats: OrderedDict[int, _ChatState] = OrderedDict()
         self.expiry_seconds = message_expiry_seconds
+        self.max_chats = max_chats
+        # 多个实例共同运行时复读状态保存在共享的存储中，没有时使用进程内的状态
+        self.state = state if state is not None and state.shared else None
 
-    async def handle_message(self, message: aiogram.types.Message):
+    async def handle_message(self, message: aiogram.types.Message, features: FeatureContext | None = None):
         """Handle incoming messages and repeat when a threshold is met"""
         chat_id = message.chat.id
-        if message.text:
-            content = message.text
-        elif message.sticker:
-            content = message.sticker.file_id
-        elif message.photo:
-            content = message.photo[0].file_id
-        else:
+        key = content_key(message)
+        if key is None:
+            return
+
+        features = features or await config.get_feature_context(chat_id)
+        if not features.is_enabled('repeater'):
             return
 
-        if not await config.is_feature_enabled('repeater', message.chat.id):
+        should_repeat = await self._record_shared(chat_id, key) if self.state else self._record(chat_id, key)
+        if not should_repeat:
             return
+        # if the message replies to another message, copy it with the reply_to_message_id
+        if message.reply_to_message:
+            await message.copy_to(chat_id, reply_to_message_id=message.reply_to_message.message_id)
+        else:
+            await message.copy_to(chat_id)
+
+    def _record(self, chat_id: int, key: int) -> bool:
+        """记录一条消息，返回是否应该复读"""
+        now = time.monotonic()
+        self._evict(now, chat_id)
+        state = self.chats.get(chat_id)
+        if state is None or state.last_key != key or now - state.last_seen > self.expiry_seconds:
+            self.chats[chat_id] = _ChatState(key, now)
+            self.chats.move_to_end(chat_id)
+            return False
+        state.count += 1
+        state.last_seen = now
+        self.chats.move_to_end(chat_id)
+        # 同一条消息连续出现两次时复读一次
+        if state.count >= 2 and not state.repeated:
+            state.repeated = True
+            return True
+        return False
+
+    async def _record_shared(self, chat_id: int, key: int) -> bool:
+        """
+        在共享存储中记录一条消息，规则与 _record 相同，多个实例同时收到时只有一个会复读
+
+        群组的状态保存为 "消息指纹:连续次数"，过期时间随每条消息刷新，对应 _record 中的 last_seen；
+        用 compare_and_set 更新，并发修改时重新读取再试
+        """
+        name = f"repeater:{chat_id}"
+        for _ in range(SHARED_UPDATE_ATTEMPTS):
+            previous = await self.state.get(name)
+            last_key, _, count = (previous or '').partition(':')
+            count = int(count) + 1 if last_key == str(key) else 1
+            # 复读只发生在第二次，之后的次数没有区别，不再增加
+            if await self.state.compare_and_set(name, previous, f"{key}:{min(count, 3)}", self.expiry_seconds):
+                return count == 2
+        return False
+
+    def _evict(self, now: float, incoming_chat_id: int):
+        """
+        移除过期的群组；群组数已达上限且消息来自尚未记录的群组时，移除最久没有消息的群组
 
-        # Clean expired messages
-        self._clean_expired_messages(chat_id)
-
-        # Increment message count
-        self.message_counts[chat_id][content] += 1
-        self.message_timestamps[chat_id][content] = time.time()
-
-        # If a message appears twice and hasn't been repeated yet
-        if (content == self.last_messages[chat_id] and
-                self.message_counts[chat_id][content] >= 2 and
-                content not in self.repeated_messages[chat_id]):
-            # Mark as repeated and send the message
-            self.repeated_messages[chat_id].add(content)
-            # if the message replies to another message, copy it with the reply_to_message_id
-            if message.reply_to_message:
-                await message.copy_to(chat_id, reply_to_message_id=message.reply_to_message.message_id)
-            else:
-                await message.copy_to(chat_id)
-
-        self.last_messages[chat_id] = content
-
-    def _clean_expired_messages(self, chat_id: int):
-        """Remove messages older than expiry_seconds"""
-        current_time = time.time()
-        expired_messages = []
-
-        for text, timestamp in self.message_timestamps[chat_id].items():
-            if current_time - timestamp > self.expiry_seconds:
-                expired_messages.append(text)
-
-        for text in expired_messages:
-            del self.message_counts[chat_id][text]
-            del self.message_timestamps[chat_id][text]
-            self.repeated_messages[chat_id].discard(text)
\ No newline at end of file
+        已经记录的群组不会增加群组数，不能为它腾出位置，否则群组最多时它自己的复读状态会被先删掉
+        """
+        chats = self.chats
+        while chats:
+            chat_id, state = next(iter(chats.items()))
+            full = incoming_chat_id not in chats and len(chats) >= self.max_chats
+            if now - state.last_seen <= self.expiry_seconds and not full:
+                break
+            del chats[chat_id]
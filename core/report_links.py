@@ -2,11 +2,12 @@ import re
 
 from aiogram.types import Message
 
-from config import config
+from config import config, FeatureContext
 
 
-async def report_broken_links(message: Message):
-    if not await config.is_feature_enabled('link', message.chat.id):
+async def report_broken_links(message: Message, features: FeatureContext | None = None):
+    features = features or await config.get_feature_context(message.chat.id)
+    if not features.is_enabled('link'):
         return
     # 获取被回复的消息中的链接
     links = []
@@ -1,84 +1,208 @@
-from aiogram.types import Message
+import html
+import logging
+import re
+import time
+from datetime import date, datetime, timedelta
 
-from config import config
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 
+from config import config, FeatureContext
 
-async def handle_stats_command(message: Message):
+# 羡慕/卖菜统计在主消息里最多显示的人数，以及翻页时每页的人数
+SECTION_LIMIT = 10
+PAGE_SIZE = 20
+
+# 计数器 -> (标题, 单位, 查看完整列表的按钮文本)
+COUNTER_SECTIONS = {
+    'xm_count': ("🍋 羡慕统计", "次羡慕", "完整羡慕统计"),
+    'wocai_count': ("🥬 卖菜统计", "次卖菜", "完整卖菜统计"),
+}
+
+# chat_id -> (统计版本号, 生成时间, 文本, 按钮)
+_stats_cache: dict[int, tuple[int, float, str, InlineKeyboardMarkup | None]] = {}
+
+
+def _display_name(user_id: int, user_data: dict) -> str:
+    return html.escape(user_data.get('name') or user_data.get('username') or str(user_id))
+
+def _get_cached_stats(chat_id: int, version: int) -> tuple[str, InlineKeyboardMarkup | None] | None:
+    """在统计变化不大且未超时的情况下返回缓存的统计消息"""
+    cached = _stats_cache.get(chat_id)
+    if not cached:
+        return None
+    cached_version, rendered_at, text, markup = cached
+    ttl = config.get_config_value('features.stats.cache_ttl', 60)
+    threshold = config.get_config_value('features.stats.cache_threshold', 50)
+    if version - cached_version > threshold or time.monotonic() - rendered_at > ttl:
+        del _stats_cache[chat_id]
+        return None
+    return text, markup
+
+async def render_stats(chat_id: int) -> tuple[str, InlineKeyboardMarkup | None] | None:
+    """生成群组统计消息，没有统计数据时返回 None"""
+    from adapters.db.stats import get_group_stats, count_users, get_top_users, get_24h_summary, \
+        get_24h_top_users, get_users_by_ids
+    from core.middleware.stats import stats_buffer
+    version = stats_buffer.versions[chat_id]
+    cached = _get_cached_stats(chat_id, version)
+    if cached:
+        return cached
+
+    # 先把缓冲区中的统计写入数据库，保证结果是最新的
+    await stats_buffer.flush()
+    stats = await get_group_stats(chat_id)
+    if not stats:
+        return None
+
+    # 排行榜都由数据库按索引排序并截取前几名，耗时与群成员数量无关
+    top_users = await get_top_users(chat_id, 'message_count')
+    messages_24h, active_users_24h = await get_24h_summary(chat_id)
+    top_24h_users = await get_24h_top_users(chat_id)
+    names_24h = await get_users_by_ids(chat_id, [user_id for user_id, _ in top_24h_users])
+
+    # 构建统计消息
+    lines = [
+        "📊 群组统计\n",
+        f"总消息数: {stats['total_messages']}",
+        f"24小时内消息数: {messages_24h}",
+        f"活跃用户数: {await count_users(chat_id)}",
+        f"24小时内活跃用户数:{active_users_24h}\n",
+        "🏆 发言排行榜:",
+        "<blockquote expandable>" + "".join(
+            f"{i}. {_display_name(row['user_id'], row)}: {row['message_count']} 条\n"
+            for i, row in enumerate(top_users, 1)
+        ) + "</blockquote>\n",
+        "📈 24小时内发言排行榜:",
+        "<blockquote expandable>" + "".join(
+            f"{i}. {_display_name(user_id, names_24h.get(user_id, {}))}: {count} 条\n"
+            for i, (user_id, count) in enumerate(top_24h_users, 1)
+        ) + "</blockquote>\n",
+    ]
+    buttons = []
+    for counter, (title, unit, button_text) in COUNTER_SECTIONS.items():
+        section_users = await get_top_users(chat_id, counter, limit=SECTION_LIMIT)
+        if not section_users:
+            continue
+        lines.append(f"\n{title}:")
+        lines.append("<blockquote expandable>" + "".join(
+            f"{_display_name(row['user_id'], row)}: {row[counter]} {unit}\n" for row in section_users
+        ) + "</blockquote>\n")
+        if len(section_users) == SECTION_LIMIT and await count_users(chat_id, counter) > SECTION_LIMIT:
+            buttons.append(InlineKeyboardButton(text=button_text, callback_data=f"stats:{counter}:0"))
+
+    text = "\n".join(lines)
+    markup = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    _stats_cache[chat_id] = (version, time.monotonic(), text, markup)
+    return text, markup
+
+async def render_stats_page(chat_id: int, counter: str, page: int) -> tuple[str, InlineKeyboardMarkup]:
+    """生成羡慕/卖菜统计的某一页"""
+    from adapters.db.stats import count_users, get_top_users
+    title, unit, _ = COUNTER_SECTIONS[counter]
+    total = await count_users(chat_id, counter)
+    pages = max(1, -(-total // PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    rows = await get_top_users(chat_id, counter, limit=PAGE_SIZE, offset=page * PAGE_SIZE)
+    text = f"{title} ({page + 1}/{pages}):\n" + "".join(
+        f"{i}. {_display_name(row['user_id'], row)}: {row[counter]} {unit}\n"
+        for i, row in enumerate(rows, page * PAGE_SIZE + 1)
+    )
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="◀ 上一页", callback_data=f"stats:{counter}:{page - 1}"))
+    if page < pages - 1:
+        nav.append(InlineKeyboardButton(text="下一页 ▶", callback_data=f"stats:{counter}:{page + 1}"))
+    keyboard = [nav] if nav else []
+    keyboard.append([InlineKeyboardButton(text="返回", callback_data="stats:main:0")])
+    return text, InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def parse_stats_range(args: list[str]) -> tuple[date, date] | None:
+    """解析 /stats 的时间范围参数，支持 7d、30d 这样的天数，或者一个/两个 YYYY-MM-DD 日期"""
+    from adapters.db.stats import STATS_TZ
+    today = datetime.now(tz=STATS_TZ).date()
+    if len(args) == 1 and (match := re.fullmatch(r'(\d+)d', args[0].lower())):
+        days = int(match.group(1))
+        if days < 1:
+            raise ValueError("天数至少为 1")
+        try:
+            return today - timedelta(days=days - 1), today
+        except OverflowError:
+            raise ValueError("天数过大") from None
+    if 1 <= len(args) <= 2:
+        start = date.fromisoformat(args[0])
+        end = date.fromisoformat(args[1]) if len(args) == 2 else start
+        if start > end:
+            start, end = end, start
+        return start, end
+    raise ValueError("参数过多")
+
+async def render_range_stats(chat_id: int, start: date, end: date) -> str:
+    """根据每日汇总生成一段时间内的统计消息"""
+    from adapters.db.stats import get_range_summary, get_range_top_users, get_users_by_ids
+    total, active_users = await get_range_summary(chat_id, start, end)
+    top_users = await get_range_top_users(chat_id, start, end)
+    names = await get_users_by_ids(chat_id, [user_id for user_id, _ in top_users])
+    period = start.isoformat() if start == end else f"{start.isoformat()} ~ {end.isoformat()}"
+    lines = [
+        f"📅 {period} 统计\n",
+        f"消息数: {total}",
+        f"活跃用户数: {active_users}\n",
+        "🏆 发言排行榜:",
+        "<blockquote expandable>" + "".join(
+            f"{i}. {_display_name(user_id, names.get(user_id, {}))}: {count} 条\n"
+            for i, (user_id, count) in enumerate(top_users, 1)
+        ) + "</blockquote>",
+        "<i>每日统计每 10 分钟汇总一次，最近的消息可能还没有计入</i>",
+    ]
+    return "\n".join(lines)
+
+async def handle_stats_command(message: Message, features: FeatureContext | None = None):
     """处理统计命令"""
-    if not await config.is_feature_enabled('stats', message.chat.id):
+    features = features or await config.get_feature_context(message.chat.id)
+    if not features.is_enabled('stats'):
         return
     if message.chat.type not in ['group', 'supergroup']:
         await message.reply("此命令仅在群组中可用")
         return
-    from adapters.db.stats import get_group_stats
-    stats = await get_group_stats(message.chat.id)
-
-    if not stats:
+    args = message.text.split()[1:] if message.text else []
+    if args:
+        try:
+            start, end = parse_stats_range(args)
+        except ValueError:
+            await message.reply("用法： /stats [天数d | 开始日期 [结束日期]]\n例如：/stats 7d、/stats 2025-01-01 2025-01-31")
+            return
+        await message.reply(await render_range_stats(message.chat.id, start, end))
+        return
+    rendered = await render_stats(message.chat.id)
+    if not rendered:
         await message.reply("暂无统计数据")
         return
+    text, markup = rendered
+    await message.reply(text, reply_markup=markup)
 
-    stats_message = await message.reply("正在生成统计信息...")
-
-    # 按消息数量排序用户
-    sorted_users = sorted(
-        stats['users'].items(),
-        key=lambda x: x[1]['message_count'],
-        reverse=True
-    )
-    active = stats.get('messages_24h', {}).get('active_users', {})
-    sorted_24h_users = sorted(
-        [
-            (user_id, stats['users'].get(user_id) or stats['users'].get(int(user_id), {}))
-            for user_id in active.keys()
-        ],
-        key=lambda x: active.get(x[0], 0),
-        reverse=True
-    )
-    sorted_most_xm_users = sorted(
-        stats['users'].items(),
-        key=lambda x: x[1].get('xm_count',0),
-        reverse=True
-    )
-    sorted_most_wocai_users = sorted(
-        stats['users'].items(),
-        key=lambda x: x[1].get('wocai_count',0),
-        reverse=True
-    )
-
-
-    # 构建统计消息
-    text = f"📊 群组统计\n\n"
-    text += f"总消息数: {stats['total_messages']}\n"
-    text += f"24小时内消息数: {stats['messages_24h']['message_count']}\n"
-    text += f"活跃用户数: {len(stats['users'])}\n"
-    text += f"24小时内活跃用户数:{len(stats['messages_24h']['active_users'])}\n\n"
-    text += "🏆 发言排行榜:\n"
-    text += "<blockquote expandable>"
-    for i, (user_id, user_data) in enumerate(sorted_users[:10], 1):
-        name = user_data['name'] or user_data['username'] or str(user_id)
-        text += f"{i}. {name}: {user_data['message_count']} 条\n"
-    text += "</blockquote>\n\n"
-    text += "📈 24小时内发言排行榜:\n"
-    text += "<blockquote expandable>"
-    for i, (user_id, user_data) in enumerate(sorted_24h_users[:10], 1):
-        name = user_data['name'] or user_data['username'] or str(user_id)
-        text += f"{i}. {name}: {stats['messages_24h']['active_users'][user_id]} 条\n"
-    text += "</blockquote>\n\n"
-    if sorted_most_xm_users and any(user_data['xm_count'] > 0 for _, user_data in sorted_most_xm_users):
-        text += "\n🍋 羡慕统计:\n"
-        text += "<blockquote expandable>"
-        for user_id, user_data in sorted_most_xm_users:
-            if user_data['xm_count'] > 0:
-                name = user_data['name'] or user_data['username'] or str(user_id)
-                text += f"{name}: {user_data['xm_count']} 次羡慕\n"
-        text += "</blockquote>\n\n"
-    if sorted_most_wocai_users and any(user_data['wocai_count'] > 0 for _, user_data in sorted_most_wocai_users):
-        text += "\n🥬 卖菜统计:\n"
-        text += "<blockquote expandable>"
-        for user_id, user_data in sorted_most_wocai_users:
-            if user_data['wocai_count'] > 0:
-                name = user_data['name'] or user_data['username'] or str(user_id)
-                text += f"{name}: {user_data['wocai_count']} 次卖菜\n"
-        text += "</blockquote>\n"
-
-    await stats_message.edit_text(text)
\ No newline at end of file
+async def handle_stats_callback(callback: CallbackQuery, features: FeatureContext | None = None):
+    """处理统计消息上的翻页按钮"""
+    chat_id = callback.message.chat.id
+    features = features or await config.get_feature_context(chat_id)
+    if not features.is_enabled('stats'):
+        await callback.answer()
+        return
+    _, section, page = callback.data.split(':')
+    if section == 'main':
+        rendered = await render_stats(chat_id)
+        if not rendered:
+            await callback.answer("暂无统计数据")
+            return
+        text, markup = rendered
+    elif section in COUNTER_SECTIONS:
+        text, markup = await render_stats_page(chat_id, section, int(page))
+    else:
+        await callback.answer()
+        return
+    try:
+        await callback.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest as e:
+        # 内容没有变化时 Telegram 会拒绝编辑，忽略即可
+        logging.debug(f"编辑统计消息失败: {e}")
+    await callback.answer()
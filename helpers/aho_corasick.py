@@ -0,0 +1,65 @@
+from collections import deque
+from typing import Iterable
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton that maps keywords to labels.
+
+    `match` scans the text once and returns the labels of every keyword found
+    in it, no matter how many keywords are registered.
+    """
+
+    def __init__(self, keywords: dict[str, Iterable[str]]):
+        """
+        Args:
+            keywords: keyword -> labels the keyword counts towards
+        """
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[frozenset[str]] = [frozenset()]
+        for keyword, labels in keywords.items():
+            if keyword:
+                self._add(keyword, frozenset(labels))
+        self._labels = frozenset().union(*self._out)
+        self._build_fail_links()
+
+    def _add(self, keyword: str, labels: frozenset[str]) -> None:
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(frozenset())
+            state = next_state
+        self._out[state] |= labels
+
+    def _build_fail_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] |= self._out[self._fail[next_state]]
+
+    def match(self, text: str) -> set[str]:
+        """Return the labels of all keywords contained in text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found: set[str] = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found |= out[state]
+                if len(found) == len(self._labels):
+                    break
+        return found
@@ -0,0 +1,84 @@
+import json
+import re
+import timeit
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+from helpers.clearurls import ClearURLsRules
+
+SAMPLE_URLS = [
+    'https://www.amazon.co.jp/dp/B0C1234567?tag=foo-22&ref_=nav_signin&pd_rd_w=abc&th=1',
+    'https://www.google.com/search?q=python&ei=abc&ved=0ahUKEw&sourceid=chrome&ie=UTF-8',
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ&feature=share&si=abcdef',
+    'https://twitter.com/user/status/1234567890?s=20&t=abcdefg',
+    'https://www.reddit.com/r/python/comments/abc/title/?utm_source=share&utm_medium=web2x',
+    'https://example.com/article?id=42&utm_source=newsletter&utm_campaign=spring&fbclid=IwAR0abc',
+    'https://blog.example.org/post/1?gclid=abc123&page=2',
+    'https://www.aliexpress.com/item/100500.html?spm=a2g0o.home&algo_pvid=abc&aff_platform=link',
+    'https://github.com/owner/repo/issues/1',
+    'https://news.ycombinator.com/item?id=1',
+]
+
+
+def legacy_tracking_params(url, rules) -> set[str]:
+    """Rule lookup alone, as the previous implementation did it."""
+    for site, rule in rules['providers'].items():
+        if re.match(rule['urlPattern'], url):
+            keys = [k for k, v in parse_qsl(urlparse(url).query)]
+            return {k for k in keys if any(re.fullmatch(param, k) for param in rule['rules'])}
+    return set()
+
+def compiled_tracking_params(url, rules: ClearURLsRules) -> set[str]:
+    parsed = urlparse(url)
+    return rules.tracking_params(url, parsed.hostname, (k for k, v in parse_qsl(parsed.query)))
+
+def legacy_remove_tracking_params(url, rules):
+    """The previous implementation: first provider whose raw urlPattern matches, uncompiled rules."""
+    parsed = urlparse(url)
+    matched_rule = None
+    for site, rule in rules['providers'].items():
+        if re.match(rule['urlPattern'], url):
+            matched_rule = rule
+            break
+    if not matched_rule or not matched_rule['rules']:
+        return url
+    query = parse_qsl(parsed.query, keep_blank_values=False)
+    filtered_query = [
+        (k, v) for k, v in query
+        if not any(re.fullmatch(param, k) for param in matched_rule['rules'])
+    ]
+    return urlunparse(parsed._replace(query=urlencode(filtered_query)))
+
+def compiled_remove_tracking_params(url, rules: ClearURLsRules):
+    parsed = urlparse(url)
+    if not parsed.query:
+        return url
+    query = parse_qsl(parsed.query, keep_blank_values=True)
+    tracking_params = rules.tracking_params(url, parsed.hostname, (k for k, v in query))
+    if not tracking_params:
+        return url
+    return urlunparse(parsed._replace(query=urlencode([(k, v) for k, v in query if k not in tracking_params])))
+
+def bench(function, rules, number: int) -> float:
+    """Return microseconds per URL."""
+    elapsed = min(timeit.repeat(lambda: [function(url, rules) for url in SAMPLE_URLS], number=number, repeat=5))
+    return elapsed / number / len(SAMPLE_URLS) * 1e6
+
+def main(path: str = 'assets/clearurls.json', number: int = 200) -> None:
+    with open(path, 'r', encoding='utf-8') as f:
+        raw_rules = json.load(f)
+    load_time = timeit.timeit(lambda: ClearURLsRules(raw_rules), number=1)
+    compiled_rules = ClearURLsRules(raw_rules)
+
+    print(f"compile ruleset: {load_time * 1000:.1f} ms, {len(compiled_rules.providers)} providers")
+    for title, legacy_function, compiled_function in (
+        ('rule lookup', legacy_tracking_params, compiled_tracking_params),
+        ('remove_tracking_params', legacy_remove_tracking_params, compiled_remove_tracking_params),
+    ):
+        legacy = bench(legacy_function, raw_rules, number)
+        compiled = bench(compiled_function, compiled_rules, number)
+        print(f"{title}: legacy {legacy:.1f} us/url, compiled {compiled:.1f} us/url ({legacy / compiled:.1f}x)")
+    for url in SAMPLE_URLS:
+        print(f"  {url}\n    -> {compiled_remove_tracking_params(url, compiled_rules)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+import json
+import re
+from typing import Iterable, NamedTuple
+
+# urlPattern 开头的协议部分，以及其后可选的子域名分组，例如 (?:[a-z0-9-]+\.)*? 或 (?:www\.)?
+_SCHEME_PREFIX = re.compile(r'\^?https\?:(?:\\/|/){2}')
+_SUBDOMAIN_GROUP = re.compile(r'\((?:\?:)?[^()]*\\\.\)[*+?]*\??')
+# 域名的第一个标签，必须以 \.、. 或者 (?:\. 这样的分组结束，才能确定它是一个完整的标签
+_FIRST_LABEL = re.compile(r'((?:[a-z0-9]|\\?-)+)(?=\\?\.|\((?:\?:)?\\\.)')
+
+
+class Provider(NamedTuple):
+    name: str
+    url_pattern: re.Pattern
+    # 所有参数规则合并成的一个正则，对参数名使用 fullmatch
+    params: re.Pattern | None
+    exceptions: re.Pattern | None
+
+    def is_exception(self, url: str) -> bool:
+        return self.exceptions is not None and self.exceptions.match(url) is not None
+
+
+def _merge(patterns: Iterable[str]) -> re.Pattern | None:
+    patterns = list(patterns)
+    if not patterns:
+        return None
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+
+def _split_alternatives(pattern: str, start: int) -> list[str] | None:
+    """Split the group opening at pattern[start] into its top-level alternatives."""
+    body_start = start + 3 if pattern.startswith('(?:', start) else start + 1
+    depth, alternatives, last = 0, [], body_start
+    position = start - 1
+    while (position := position + 1) < len(pattern):
+        char = pattern[position]
+        if char == '\\':
+            # 跳过被转义的字符
+            position += 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                alternatives.append(pattern[last:position])
+                return alternatives
+        elif char == '|' and depth == 1:
+            alternatives.append(pattern[last:position])
+            last = position + 1
+    return None
+
+def _first_label(pattern: str, position: int = 0) -> str | None:
+    label = _FIRST_LABEL.match(pattern, position)
+    return label.group(1).replace('\\', '') if label else None
+
+def index_labels(url_pattern: str) -> tuple[str, ...] | None:
+    """
+    Return hostname labels one of which every URL matched by url_pattern
+    contains, or None if they can't be read off the pattern.
+    """
+    match = _SCHEME_PREFIX.match(url_pattern)
+    if not match:
+        return None
+    position = match.end()
+    while group := _SUBDOMAIN_GROUP.match(url_pattern, position):
+        position = group.end()
+    if label := _first_label(url_pattern, position):
+        return (label,)
+    if not url_pattern.startswith('(', position):
+        return None
+    # (youtube\.com|youtu\.be) 这样由几个域名组成的分组
+    alternatives = _split_alternatives(url_pattern, position)
+    if not alternatives:
+        return None
+    labels = tuple(_first_label(alternative) for alternative in alternatives)
+    return None if None in labels else labels
+
+
+class ClearURLsRules:
+    """
+    ClearURLs ruleset compiled once at load.
+
+    Providers are indexed by a hostname label taken from their urlPattern, so
+    a URL is only matched against the providers of its own labels plus the few
+    whose pattern can't be indexed (globalRules among them).
+    """
+
+    def __init__(self, data: dict):
+        self.providers: list[Provider] = []
+        self._by_label: dict[str, list[Provider]] = {}
+        self._unindexed: list[Provider] = []
+        for name, rule in data['providers'].items():
+            provider = Provider(
+                name=name,
+                url_pattern=re.compile(rule['urlPattern']),
+                params=_merge(rule.get('rules', ())),
+                exceptions=_merge(rule.get('exceptions', ())),
+            )
+            # 没有参数规则的 provider 对清理参数没有作用
+            if provider.params is None:
+                continue
+            self.providers.append(provider)
+            labels = index_labels(rule['urlPattern'])
+            if labels is None:
+                self._unindexed.append(provider)
+            for label in labels or ():
+                self._by_label.setdefault(label, []).append(provider)
+
+    @classmethod
+    def load(cls, path: str) -> 'ClearURLsRules':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def candidates(self, hostname: str | None) -> list[Provider]:
+        """Providers that may apply to a URL on hostname, the unindexed ones first."""
+        candidates = list(self._unindexed)
+        if hostname:
+            for label in set(hostname.lower().split('.')):
+                candidates.extend(self._by_label.get(label, ()))
+        return candidates
+
+    def tracking_params(self, url: str, hostname: str | None, keys: Iterable[str]) -> set[str]:
+        """Return the query keys of url that some applicable provider marks as tracking params."""
+        keys = set(keys)
+        tracking = set()
+        for provider in self.candidates(hostname):
+            if not provider.url_pattern.match(url):
+                continue
+            matched = {key for key in keys if provider.params.fullmatch(key)}
+            # 例外规则比较长，只有确实要删除参数时才检查
+            if matched and not provider.is_exception(url):
+                tracking |= matched
+        return tracking
@@ -0,0 +1,151 @@
+import unicodedata
+from functools import lru_cache
+from typing import Hashable, Iterable, NamedTuple
+
+# 容易与拉丁字母混淆的字符 -> 对应的小写拉丁字母，摘自 Unicode confusables.txt 中最常见的部分
+# 全角字符、数学字母等兼容字符由 NFKC 处理，不需要列在这里
+CONFUSABLES = {
+    # ASCII 内部的混淆
+    '0': 'o', '1': 'l', 'I': 'l', '|': 'l',
+    # 西里尔字母
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'о': 'o', 'р': 'p', 'с': 'c', 'у': 'y', 'х': 'x', 'і': 'i', 'ї': 'i',
+    'ј': 'j', 'ԁ': 'd', 'ѕ': 's', 'һ': 'h', 'ԛ': 'q', 'ԝ': 'w', 'ү': 'y', 'к': 'k', 'м': 'm', 'н': 'h', 'т': 't',
+    'п': 'n', 'г': 'r', 'ь': 'b',
+    'А': 'a', 'В': 'b', 'Е': 'e', 'Ё': 'e', 'К': 'k', 'М': 'm', 'Н': 'h', 'О': 'o', 'Р': 'p', 'С': 'c', 'Т': 't',
+    'Х': 'x', 'У': 'y', 'І': 'l', 'Ї': 'l', 'Ј': 'j', 'Ѕ': 's', 'Ԁ': 'd', 'Ү': 'y', 'Ԛ': 'q', 'Ԝ': 'w',
+    # 希腊字母
+    'α': 'a', 'β': 'b', 'γ': 'y', 'ε': 'e', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p', 'σ': 'o', 'τ': 't',
+    'υ': 'u', 'χ': 'x', 'ω': 'w',
+    'Α': 'a', 'Β': 'b', 'Ε': 'e', 'Ζ': 'z', 'Η': 'h', 'Ι': 'l', 'Κ': 'k', 'Μ': 'm', 'Ν': 'n', 'Ο': 'o', 'Ρ': 'p',
+    'Τ': 't', 'Υ': 'y', 'Χ': 'x',
+    # 其他拉丁字母变体
+    'ı': 'i', 'ɑ': 'a', 'ɡ': 'g', 'ɩ': 'i', 'ɪ': 'i', 'ʏ': 'y', 'ℓ': 'l',
+}
+# 多个字符组合起来像另一个字符的情况，在单字符替换之后处理
+CONFUSABLE_SEQUENCES = (('rn', 'm'), ('vv', 'w'))
+
+# 规范化时直接去掉的字符类别：组合附加符号、零宽字符等格式字符、控制字符和各种空白
+_DROPPED_CATEGORIES = frozenset(('Mn', 'Me', 'Cf', 'Cc', 'Zs', 'Zl', 'Zp'))
+
+
+class _SkeletonTable(dict):
+    """str.translate 使用的转换表，第一次遇到某个字符时才计算并记住它的转换结果"""
+    def __missing__(self, codepoint: int) -> str | None:
+        char = chr(codepoint)
+        if char in CONFUSABLES:
+            value = CONFUSABLES[char]
+        elif unicodedata.category(char) in _DROPPED_CATEGORIES:
+            value = None
+        else:
+            value = char
+        self[codepoint] = value
+        return value
+
+_skeleton_table = _SkeletonTable()
+
+@lru_cache(maxsize=4096)
+def skeleton(text: str) -> str:
+    """
+    Reduce a string to a form where visually confusable strings are equal.
+
+    Compatibility characters are folded with NFKC, invisible characters,
+    whitespace and combining marks are dropped, homoglyphs are mapped to the
+    Latin letter they imitate and the result is case-folded.
+    """
+    text = unicodedata.normalize('NFKD', text).translate(_skeleton_table)
+    text = unicodedata.normalize('NFKC', text).casefold()
+    for sequence, replacement in CONFUSABLE_SEQUENCES:
+        text = text.replace(sequence, replacement)
+    return text
+
+def within_one_edit(a: str, b: str) -> bool:
+    """Whether a can be turned into b with at most one insertion, deletion or substitution."""
+    if a == b:
+        return True
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) > 1:
+        return False
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:]
+
+
+def _plain(text: str) -> str:
+    """Fold case, compatibility forms and whitespace, but keep homoglyphs and invisible characters apart."""
+    return ''.join(unicodedata.normalize('NFKC', text).casefold().split())
+
+
+class SkeletonMatch(NamedTuple):
+    owner: Hashable
+    # 被模仿的受保护名称
+    name: str
+    # 骨架完全相同（True），还是只相差一个字符（False）
+    exact: bool
+    # 骨架相同但实际字符不同，即用形近字符伪造的名称；普通的同名不算
+    spoofed: bool
+
+
+class SkeletonIndex:
+    """
+    Protected names indexed by skeleton.
+
+    `find` costs one hash lookup for an exact skeleton match, plus a bounded
+    one-edit comparison against the protected names of similar length.
+    """
+    # 太短的名称只做精确匹配，否则 David 和 Davis 这样的常见名字误判太多
+    MIN_FUZZY_LENGTH = 8
+
+    def __init__(self, names: Iterable[tuple[str, Hashable]] = ()):
+        """
+        Args:
+            names: (protected name, owner) pairs, the owner is never matched against its own name
+        """
+        self._exact: dict[str, dict[Hashable, str]] = {}
+        self._by_length: dict[int, list[str]] = {}
+        for name, owner in names:
+            self.add(name, owner)
+
+    def add(self, name: str, owner: Hashable) -> None:
+        key = skeleton(name)
+        if not key:
+            return
+        if key not in self._exact:
+            self._exact[key] = {}
+            if len(key) >= self.MIN_FUZZY_LENGTH:
+                self._by_length.setdefault(len(key), []).append(key)
+        self._exact[key][owner] = name
+
+    def find(self, name: str, exclude: Hashable = None) -> SkeletonMatch | None:
+        """Return the protected name that name imitates, or None."""
+        key = skeleton(name)
+        if not key:
+            return None
+        match = self._match(key, exclude, name, exact=True)
+        if match is not None:
+            return match
+        if len(key) < self.MIN_FUZZY_LENGTH:
+            return None
+        for length in (len(key) - 1, len(key), len(key) + 1):
+            for candidate in self._by_length.get(length, ()):
+                if candidate != key and within_one_edit(key, candidate):
+                    match = self._match(candidate, exclude, name, exact=False)
+                    if match is not None:
+                        return match
+        return None
+
+    def _match(self, key: str, exclude: Hashable, name: str, exact: bool) -> SkeletonMatch | None:
+        found = None
+        for owner, protected in self._exact.get(key, {}).items():
+            if owner == exclude:
+                continue
+            spoofed = exact and _plain(name) != _plain(protected)
+            # 同一个骨架可能对应几个名称，优先返回伪造的那个
+            if found is None or spoofed:
+                found = SkeletonMatch(owner, protected, exact, spoofed)
+                if spoofed:
+                    break
+        return found
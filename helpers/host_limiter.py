@@ -0,0 +1,128 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+# 保留状态的主机数量，超过时丢弃最久没有使用的空闲主机
+MAX_TRACKED_HOSTS = 1024
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to a host that keeps failing."""
+
+
+class _HostState:
+    __slots__ = ('semaphore', 'active', 'srtt', 'rttvar', 'failures', 'open_until', 'probing')
+
+    def __init__(self, max_concurrency: int):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.active = 0
+        # 平滑后的耗时和耗时的平均偏差，计算方式与 TCP 的重传超时相同
+        self.srtt: float | None = None
+        self.rttvar = 0.0
+        # 连续失败的次数，以及熔断结束的时间
+        self.failures = 0
+        self.open_until = 0.0
+        # 熔断结束后只放行一个试探请求
+        self.probing = False
+
+
+class HostLimiter:
+    """
+    Per-host guard for outgoing requests.
+
+    Limits concurrent requests to each host, derives each host's timeout from
+    an EWMA of its observed latency, and after `failure_threshold` consecutive
+    failures short-circuits the host for `cooldown` seconds. After the
+    cool-down a single probe request decides whether the host is back.
+    """
+
+    def __init__(self, max_concurrency: int = 4, min_timeout: float = 2, max_timeout: float = 10,
+                 failure_threshold: int = 5, cooldown: float = 60, alpha: float = 0.125, beta: float = 0.25):
+        self.max_concurrency = max_concurrency
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.beta = beta
+        self._hosts: OrderedDict[str, _HostState] = OrderedDict()
+
+    def _state(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.max_concurrency)
+            if len(self._hosts) > MAX_TRACKED_HOSTS:
+                for idle in [h for h, s in self._hosts.items() if s.active == 0 and h != host][:len(self._hosts) - MAX_TRACKED_HOSTS]:
+                    del self._hosts[idle]
+        self._hosts.move_to_end(host)
+        return state
+
+    def timeout_for(self, host: str) -> float:
+        """Seconds a request to host may take, max_timeout until its latency has been observed."""
+        state = self._hosts.get(host)
+        if state is None or state.srtt is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, state.srtt + 4 * state.rttvar))
+
+    def _observe(self, state: _HostState, elapsed: float) -> None:
+        if state.srtt is None:
+            state.srtt, state.rttvar = elapsed, elapsed / 2
+        else:
+            state.rttvar = (1 - self.beta) * state.rttvar + self.beta * abs(state.srtt - elapsed)
+            state.srtt = (1 - self.alpha) * state.srtt + self.alpha * elapsed
+
+    def _record_success(self, state: _HostState, elapsed: float) -> None:
+        self._observe(state, elapsed)
+        state.failures = 0
+
+    def _record_failure(self, state: _HostState, elapsed: float, timeout: float) -> None:
+        if elapsed >= timeout:
+            # 超时的请求说明实际耗时至少是超时时间，把估计值往上调
+            self._observe(state, timeout)
+        state.failures += 1
+        if state.failures >= self.failure_threshold:
+            state.open_until = time.monotonic() + self.cooldown
+
+    def _admit(self, state: _HostState, host: str) -> bool:
+        """Raise CircuitOpenError if host is short-circuited, return whether the request is the probe."""
+        if state.failures < self.failure_threshold:
+            return False
+        if state.open_until > time.monotonic() or state.probing:
+            raise CircuitOpenError(host)
+        state.probing = True
+        return True
+
+    @asynccontextmanager
+    async def request(self, host: str) -> AsyncIterator[float]:
+        """
+        Guard one request to host, yielding the timeout to use for it.
+
+        Raises CircuitOpenError if the host is short-circuited, either right
+        away or once a slot frees up, and asyncio.TimeoutError if no slot
+        frees up within max_timeout. Leaving the block with an exception
+        counts as a failure of the host.
+        """
+        state = self._state(host)
+        probe = self._admit(state, host)
+        state.active += 1
+        try:
+            await asyncio.wait_for(state.semaphore.acquire(), self.max_timeout)
+            try:
+                # 等待期间其他请求可能已经让主机进入熔断
+                probe = probe or self._admit(state, host)
+                timeout = self.timeout_for(host)
+                started = time.monotonic()
+                try:
+                    yield timeout
+                except Exception:
+                    self._record_failure(state, time.monotonic() - started, timeout)
+                    raise
+                self._record_success(state, time.monotonic() - started)
+            finally:
+                state.semaphore.release()
+        finally:
+            state.active -= 1
+            if probe:
+                state.probing = False
@@ -1,10 +1,67 @@
 import asyncio
 import os
 from pathlib import Path
+from collections import defaultdict
+from datetime import datetime
 from tortoise import Tortoise
-from adapters.db.models import Stats, MinecraftBindings, FediClients, FediUserTokens
+from tortoise.exceptions import OperationalError
+from tortoise.transactions import in_transaction
+from adapters.db.core import init_db
+from adapters.db.models import Stats, ChatUserStats, ChatActivityBucket, MinecraftBindings, FediClients, FediUserTokens
+from adapters.db.stats import current_bucket, WINDOW_BUCKETS
 import json
 
+def _load_json_blob(value) -> dict:
+    """Decode a legacy JSON blob, which may have been stored as a (double-)encoded string"""
+    while isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+async def _import_stats_blob(chat_id: int, chat_title: str | None, total_messages: int, users: dict, messages_24h: dict) -> None:
+    """Write one chat's legacy stats blob into the normalized stats tables"""
+    stats_obj, created = await Stats.get_or_create(chat_id=chat_id)
+    if chat_title:
+        stats_obj.chat_title = chat_title
+    stats_obj.total_messages = total_messages or 0
+    await stats_obj.save()
+
+    await ChatUserStats.filter(chat_id=chat_id).delete()
+    await ChatUserStats.bulk_create([
+        ChatUserStats(
+            chat_id=chat_id,
+            user_id=int(uid),
+            username=data.get('username'),
+            name=data.get('name'),
+            message_count=data.get('message_count', 0),
+            xm_count=data.get('xm_count', 0),
+            wocai_count=data.get('wocai_count', 0),
+        )
+        for uid, data in users.items() if isinstance(data, dict)
+    ], batch_size=500)
+
+    # 只保留 24 小时内的消息记录，并按时间桶聚合
+    first_bucket = current_bucket() - WINDOW_BUCKETS + 1
+    buckets = defaultdict(int)
+    for msg in messages_24h.get('messages', []):
+        ts = msg.get('timestamp')
+        if ts is None or msg.get('user_id') is None:
+            continue
+        try:
+            msg_time = datetime.fromisoformat(ts) if isinstance(ts, str) else datetime.fromtimestamp(float(ts))
+        except Exception:
+            continue
+        bucket = current_bucket(msg_time.timestamp())
+        if bucket >= first_bucket:
+            buckets[(int(msg['user_id']), bucket)] += 1
+    await ChatActivityBucket.filter(chat_id=chat_id).delete()
+    await ChatActivityBucket.bulk_create([
+        ChatActivityBucket(chat_id=chat_id, user_id=user_id, bucket=bucket, message_count=count)
+        for (user_id, bucket), count in buckets.items()
+    ], batch_size=500)
+
 # message_stats.json 迁移到数据库
 async def migrate_stats() -> None:
     """Migrate stats from JSON file to database"""
@@ -16,15 +73,41 @@ async def migrate_stats() -> None:
         return
 
     for chat_id_str, stats_data in all_stats.items():
-        chat_id = int(chat_id_str)
-        stats_obj, created = await Stats.get_or_create(chat_id=chat_id)
-        stats_obj.chat_title = stats_data.get('chat_title')
-        stats_obj.total_messages = stats_data.get('total_messages', 0)
-        # 使用 json.dumps 将字典转换为 JSON 字符串，以确保不会转义
-        stats_obj.messages_24h = json.dumps(stats_data.get('messages_24h', {}),ensure_ascii=False)
-        stats_obj.users = json.dumps(stats_data.get('users', {}), ensure_ascii=False)
-        stats_obj.messages = json.dumps(stats_data.get('messages', {}),ensure_ascii=False)
-        await stats_obj.save()
+        await _import_stats_blob(
+            chat_id=int(chat_id_str),
+            chat_title=stats_data.get('chat_title'),
+            total_messages=stats_data.get('total_messages', 0),
+            users=_load_json_blob(stats_data.get('users')),
+            messages_24h=_load_json_blob(stats_data.get('messages_24h')),
+        )
+
+# 数据库中旧版 stats 表的 JSON 字段迁移到按用户拆分的表
+async def migrate_stats_blobs() -> None:
+    """Migrate legacy `users`/`messages_24h` JSON columns of the stats table into normalized tables"""
+    conn = Tortoise.get_connection('default')
+    try:
+        rows = await conn.execute_query_dict(
+            "SELECT chat_id, chat_title, total_messages, users, messages_24h FROM stats "
+            "WHERE users IS NOT NULL OR messages_24h IS NOT NULL"
+        )
+    except OperationalError:
+        print("No legacy stats columns found. Skipping.")
+        return
+
+    for row in rows:
+        async with in_transaction() as tx:
+            await _import_stats_blob(
+                chat_id=row['chat_id'],
+                chat_title=row['chat_title'],
+                total_messages=row['total_messages'],
+                users=_load_json_blob(row['users']),
+                messages_24h=_load_json_blob(row['messages_24h']),
+            )
+            await tx.execute_query(
+                "UPDATE stats SET users = NULL, messages_24h = NULL, messages = NULL WHERE chat_id = ?",
+                [row['chat_id']]
+            )
+        print(f"Migrated stats of chat {row['chat_id']}.")
 
 # mc_bindings.json 迁移到数据库
 async def migrate_mc_bindings() -> None:
@@ -99,17 +182,20 @@ async def migrate() -> None:
     if env_db_file:
         db_file_path = Path(env_db_file)
         db_path = db_file_path if db_file_path.is_absolute() else project_root / env_db_file
-    await Tortoise.init(
-        db_url=f"sqlite://{str(db_path)}",
-        modules={'models': ['adapters.db.models']}
-    )
-    await Tortoise.generate_schemas()
+    from config import config
+    await init_db(config.get_config_value('database', {}), sqlite_path=str(db_path), auto_migrate=True)
     resp1 = input("Migrate `message_stats.json`? [y/N]: ").strip().lower()
     if resp1 in ("y", "yes"):
         print("Migrating stats...")
         await migrate_stats()
     else:
         print("Skipping stats migration.")
+    resp_blobs = input("Migrate legacy stats stored in the database to per-user tables? [y/N]: ").strip().lower()
+    if resp_blobs in ("y", "yes"):
+        print("Migrating legacy stats...")
+        await migrate_stats_blobs()
+    else:
+        print("Skipping legacy stats migration.")
     resp2 = input("Migrate `mc_bindings.json`? [y/N]: ").strip().lower()
     if resp2 in ("y", "yes"):
         print("Migrating mc bindings...")
@@ -0,0 +1,288 @@
+import logging
+import os
+import pickle
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+# 缓存文件格式有变化时需要增加版本号
+CACHE_FORMAT = 1
+
+# 只对网页本身生效的规则才适用于链接清理，其它资源类型的规则会被跳过
+_DOCUMENT_TYPES = frozenset(('doc', 'document'))
+_OTHER_TYPES = frozenset((
+    'xhr', 'xmlhttprequest', 'ping', 'image', 'script', 'stylesheet', 'subdocument', 'frame', 'media', 'font',
+    'object', 'websocket', 'other',
+))
+# ||example.com^ 或 ||example.com，以及 ||amazon. 这样不限顶级域名的写法
+_HOST_PATTERN = re.compile(r'\|\|([a-z0-9-]+(?:\.[a-z0-9-]+)*)(\.\*?)?\^?')
+# 规则选项开始的 $，正则参数里也可能有 $，所以要求后面的选项里有 removeparam
+_OPTIONS_START = re.compile(r'\$(?=(?:[^,$]*,)*removeparam(?:=|,|$))')
+_REGEX_VALUE = re.compile(r'removeparam=(/.*/i?)(?=,|$)')
+
+
+class HostFilter(NamedTuple):
+    """The removeparam rules that apply to one hostname."""
+    params: frozenset[str]
+    # 正则规则匹配的是 name=value
+    patterns: tuple[re.Pattern, ...]
+
+    def matches(self, key: str, value: str) -> bool:
+        if key in self.params:
+            return True
+        if self.patterns:
+            pair = f"{key}={value}"
+            return any(pattern.search(pair) for pattern in self.patterns)
+        return False
+
+
+class _Node:
+    """One label of the domain-suffix trie, the keys of children are the labels to its left."""
+    __slots__ = ('children', 'params', 'regexes', 'exempt')
+
+    def __init__(self):
+        self.children: dict[str, _Node] = {}
+        self.params: set[str] | frozenset[str] = set()
+        self.regexes: set[str] | frozenset[str] = set()
+        # 在这个域名下不删除的参数名和正则
+        self.exempt: set[str] | frozenset[str] = set()
+
+    def child(self, label: str) -> '_Node':
+        node = self.children.get(label)
+        if node is None:
+            node = self.children[label] = _Node()
+        return node
+
+    def freeze(self) -> None:
+        self.params, self.regexes, self.exempt = frozenset(self.params), frozenset(self.regexes), frozenset(self.exempt)
+        for child in self.children.values():
+            child.freeze()
+
+
+def _convert_regex(value: str) -> str | None:
+    """Turn an adblock /regex/flags value into Python regex source, None if it doesn't compile."""
+    body, _, flags = value[1:].rpartition('/')
+    source = f"(?i:{body})" if 'i' in flags else f"(?:{body})"
+    try:
+        re.compile(source)
+    except re.error:
+        return None
+    return source
+
+def _parse_options(options: str) -> tuple[str | None, list[str], bool] | None:
+    """
+    Return (removeparam value, domain option entries, applies to documents),
+    or None if the rule is not a removeparam rule.
+    """
+    value, domains, types = None, [], set()
+    is_removeparam = False
+    # 正则里可能包含逗号，所以先把 removeparam 的正则单独取出来
+    regex_value = _REGEX_VALUE.search(options)
+    if regex_value:
+        options = options[:regex_value.start()] + 'removeparam' + options[regex_value.end():]
+    for option in options.split(','):
+        name, _, argument = option.partition('=')
+        if name == 'removeparam':
+            is_removeparam = True
+            value = regex_value.group(1) if regex_value else argument or None
+        elif name == 'domain':
+            domains = argument.split('|')
+        elif name in ('badfilter',):
+            return None
+        elif name:
+            types.add(name)
+    if not is_removeparam:
+        return None
+    if types & {'~doc', '~document'}:
+        return value, domains, False
+    positive = {t for t in types if not t.startswith('~') and (t in _DOCUMENT_TYPES or t in _OTHER_TYPES)}
+    return value, domains, not positive or bool(positive & _DOCUMENT_TYPES)
+
+
+class RemoveParamFilter:
+    """
+    The $removeparam rules of an adblock filter list, such as the bundled
+    LegitimateURLShortener.txt.
+
+    Plain param names that apply everywhere go into one frozenset, host-scoped
+    rules and exceptions into a trie keyed by reversed domain labels, so the
+    rules for a hostname are collected with one walk from its TLD inwards.
+    Rules scoped to a URL path or other parts of the URL are skipped, and
+    exceptions scoped that way are widened to the whole host, so the filter
+    may remove less than a browser would, never more.
+    """
+
+    def __init__(self):
+        self.global_params: frozenset[str] | set[str] = set()
+        self.global_regexes: dict[str, None] = {}
+        self.root = _Node()
+        # ||amazon. 这样不限顶级域名的规则，按 amazon 索引
+        self.wildcards: dict[str, _Node] = {}
+        self._setup()
+
+    def _setup(self) -> None:
+        self._global_pattern = self._compile(self.global_regexes)
+        self.for_host = lru_cache(maxsize=4096)(self._for_host)
+
+    @staticmethod
+    def _compile(sources) -> re.Pattern | None:
+        sources = list(sources)
+        return re.compile('|'.join(sources)) if sources else None
+
+    def _node(self, domain: str) -> _Node:
+        if domain.endswith('.*'):
+            node = self.wildcards.get(domain[:-2])
+            if node is None:
+                node = self.wildcards[domain[:-2]] = _Node()
+            return node
+        node = self.root
+        for label in reversed(domain.split('.')):
+            node = node.child(label)
+        return node
+
+    def add_rule(self, line: str) -> None:
+        """Add one line of the filter list, lines that aren't supported removeparam rules are ignored."""
+        line = line.strip()
+        if not line or line.startswith(('!', '[', '#')) or '$' not in line:
+            return
+        is_exception = line.startswith('@@')
+        line = line.removeprefix('@@')
+        options_start = _OPTIONS_START.search(line)
+        if options_start is None:
+            return
+        pattern, options = line[:options_start.start()], line[options_start.end():]
+        parsed = _parse_options(options)
+        if parsed is None:
+            return
+        value, domains, applies_to_documents = parsed
+        if not applies_to_documents or not value:
+            return
+        if value.startswith('/') and value.rstrip('i').endswith('/') and len(value) > 2:
+            regex = _convert_regex(value)
+            if regex is None:
+                return
+            param = None
+        else:
+            regex, param = None, value
+
+        host_match = _HOST_PATTERN.match(pattern) if pattern.startswith('||') else None
+        if host_match:
+            host = host_match.group(1) + ('.*' if host_match.group(2) else '')
+            if not is_exception and host_match.end() != len(pattern):
+                # 只对部分路径生效的规则
+                return
+            included, excluded = [host], []
+        elif pattern and not is_exception:
+            return
+        else:
+            included = [domain for domain in domains if not domain.startswith('~')]
+            excluded = [domain[1:] for domain in domains if domain.startswith('~')]
+
+        if is_exception:
+            targets = included or [None]
+            for domain in targets:
+                node = self.root if domain is None else self._node(domain)
+                node.exempt.add(param or regex)
+            return
+        if included:
+            for domain in included:
+                node = self._node(domain)
+                if param:
+                    node.params.add(param)
+                else:
+                    node.regexes.add(regex)
+        else:
+            if param:
+                self.global_params.add(param)
+            else:
+                self.global_regexes[regex] = None
+        for domain in excluded:
+            self._node(domain).exempt.add(param or regex)
+
+    def _freeze(self) -> None:
+        self.global_params = frozenset(self.global_params)
+        self.root.freeze()
+        for node in self.wildcards.values():
+            node.freeze()
+
+    @classmethod
+    def parse(cls, lines) -> 'RemoveParamFilter':
+        param_filter = cls()
+        for line in lines:
+            param_filter.add_rule(line)
+        param_filter._freeze()
+        param_filter._setup()
+        return param_filter
+
+    def _matching_nodes(self, labels: list[str]) -> list[_Node]:
+        nodes = []
+        node = self.root
+        for label in reversed(labels):
+            node = node.children.get(label)
+            if node is None:
+                break
+            nodes.append(node)
+        if self.wildcards:
+            # 不限顶级域名的规则，要求后面至少还有一个标签
+            for start in range(len(labels) - 1):
+                for end in range(start + 1, len(labels)):
+                    node = self.wildcards.get('.'.join(labels[start:end]))
+                    if node is not None:
+                        nodes.append(node)
+        return nodes
+
+    def _for_host(self, hostname: str | None) -> HostFilter:
+        nodes = self._matching_nodes(hostname.lower().split('.')) if hostname else []
+        nodes.append(self.root)
+        params, regexes, exempt = set(self.global_params), {}, set()
+        for node in nodes:
+            params |= node.params
+            regexes.update(dict.fromkeys(node.regexes))
+            exempt |= node.exempt
+        params -= exempt
+        patterns = []
+        if exempt.isdisjoint(self.global_regexes):
+            if self._global_pattern is not None:
+                patterns.append(self._global_pattern)
+        else:
+            regexes.update(self.global_regexes)
+        host_pattern = self._compile(regex for regex in regexes if regex not in exempt)
+        if host_pattern is not None:
+            patterns.append(host_pattern)
+        return HostFilter(frozenset(params), tuple(patterns))
+
+    def __getstate__(self) -> dict:
+        return {'global_params': self.global_params, 'global_regexes': self.global_regexes,
+                'root': self.root, 'wildcards': self.wildcards}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._setup()
+
+    @classmethod
+    def load(cls, path: str, cache_path: str | None = None) -> 'RemoveParamFilter':
+        """
+        Load a filter list, reusing the compiled form cached at cache_path
+        (path + '.cache' by default) while the list is unchanged.
+        """
+        cache_path = cache_path or f"{path}.cache"
+        stat = os.stat(path)
+        key = (CACHE_FORMAT, stat.st_size, stat.st_mtime_ns)
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_key, param_filter = pickle.load(f)
+            if cached_key == key:
+                return param_filter
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.debug(f"无法读取过滤列表缓存 {cache_path}: {e}")
+
+        with open(path, 'r', encoding='utf-8') as f:
+            param_filter = cls.parse(f)
+        try:
+            with open(cache_path, 'wb') as f:
+                pickle.dump((key, param_filter), f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            logging.debug(f"无法写入过滤列表缓存 {cache_path}: {e}")
+        return param_filter
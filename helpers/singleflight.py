@@ -0,0 +1,71 @@
+import asyncio
+import functools
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+# 缓存的结果超过这个数量时顺便清理已经过期的结果
+_MEMO_PRUNE_SIZE = 1024
+
+
+def single_flight(ttl: float = 0):
+    """
+    Coalesce concurrent calls of an async function with the same arguments.
+
+    While a call is running, identical calls wait for it instead of starting
+    their own, and its result is remembered for `ttl` seconds afterwards.
+    Failures are shared with the waiting calls but never remembered.
+    Results are shared between callers, so they must not be modified.
+
+    The decorated function gets `forget(*args, **kwargs)` to drop the result
+    for some arguments after a write, and `clear()` to drop everything.
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        inflight: dict[Hashable, asyncio.Task] = {}
+        memo: dict[Hashable, tuple[float, Any]] = {}
+
+        def make_key(args: tuple, kwargs: dict) -> Hashable:
+            return (args, tuple(sorted(kwargs.items()))) if kwargs else args
+
+        def on_done(key: Hashable, task: asyncio.Task) -> None:
+            # forget() 之后开始的调用会替换掉 inflight 中的任务，旧任务的结果不再缓存
+            if inflight.get(key) is not task:
+                return
+            del inflight[key]
+            if task.cancelled() or task.exception() is not None:
+                return
+            if ttl > 0:
+                now = time.monotonic()
+                if len(memo) >= _MEMO_PRUNE_SIZE:
+                    for expired in [k for k, (expires, _) in memo.items() if expires <= now]:
+                        del memo[expired]
+                memo[key] = (now + ttl, task.result())
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = make_key(args, kwargs)
+            cached = memo.get(key)
+            if cached is not None:
+                if cached[0] > time.monotonic():
+                    return cached[1]
+                del memo[key]
+            task = inflight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(func(*args, **kwargs))
+                inflight[key] = task
+                task.add_done_callback(functools.partial(on_done, key))
+            # 某个调用方被取消时不影响其他等待同一结果的调用方
+            return await asyncio.shield(task)
+
+        def forget(*args, **kwargs) -> None:
+            key = make_key(args, kwargs)
+            memo.pop(key, None)
+            inflight.pop(key, None)
+
+        def clear() -> None:
+            memo.clear()
+            inflight.clear()
+
+        wrapper.forget = forget
+        wrapper.clear = clear
+        return wrapper
+    return decorator
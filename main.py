@@ -18,9 +18,11 @@ async def main():
         logging.basicConfig(level=logging.INFO,stream=sys.stdout)
 
     tasks = []
-    cfg = config.Config()
+    tg_adapter = None
+    # 整个进程共用同一个配置实例，修改 config.yaml 后会自动重新加载
+    cfg = config.config
     # Initialize database
-    await adapters.db.core.init_db()
+    await adapters.db.core.init_db(cfg.get_config_value('database', {}))
     # Initialize and start Telegram adapter
     if cfg.get_config_value('start_telegram_bot', True):
         tg_adapter = TelegramAdapter()
@@ -31,6 +33,11 @@ async def main():
         tasks.append(matrix_bot.main())
     running_tasks = []
     if tasks:
+        # 配置文件的监视任务不会自己结束，单独运行，在机器人停止后取消
+        watcher = None
+        reload_interval = cfg.get_config_value('config_reload_interval', 5)
+        if reload_interval:
+            watcher = asyncio.create_task(cfg.watch(reload_interval))
         try:
             async with TaskGroup() as group:
                 for coro in tasks:
@@ -41,7 +48,16 @@ async def main():
         finally:
             for task in running_tasks:
                 task.cancel()
-            logging.info("All tasks cancelled successfully, closing database connection.")
+            if watcher is not None:
+                watcher.cancel()
+                await asyncio.gather(watcher, return_exceptions=True)
+            logging.info("All tasks cancelled successfully, flushing pending stats.")
+            from core.middleware.stats import stats_buffer
+            await stats_buffer.close()
+            if tg_adapter is not None:
+                logging.info("Closing state backend.")
+                await tg_adapter.state_backend.close()
+            logging.info("Closing database connection.")
             await adapters.db.core.close_db()
             logging.info("All tasks finished successfully. Exiting.")
     else:
@@ -0,0 +1,104 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import adapters.db.anti_fake_users as anti_fake_users
+import core.middleware.anti_fake_channel as anti_fake_channel
+from adapters.db.anti_fake_users import ChannelWhiteListSnapshot
+
+CHAT_ID = -1001
+CHANNEL_ID = -1002
+CHANNEL_NAME = 'Новости Канал'
+
+
+class FakeBot:
+    def __init__(self, admins=()):
+        self.admins = admins
+        self.banned = []
+
+    async def get_chat_administrators(self, chat_id):
+        return [SimpleNamespace(user=SimpleNamespace(id=user_id, full_name=name, is_bot=False))
+                for user_id, name in self.admins]
+
+    async def ban_chat_member(self, chat_id, user_id):
+        self.banned.append(user_id)
+
+
+class FakeMessage:
+    def __init__(self, bot, user_id=None, full_name=None, sender_chat=None, is_automatic_forward=False):
+        self.bot = bot
+        self.chat = SimpleNamespace(id=CHAT_ID, type='supergroup')
+        self.from_user = SimpleNamespace(id=user_id, full_name=full_name, is_bot=False) if user_id else None
+        self.sender_chat = sender_chat
+        self.is_automatic_forward = is_automatic_forward
+        self.replies = []
+        self.deleted = False
+
+    async def delete(self):
+        self.deleted = True
+
+    async def reply(self, text, **kwargs):
+        self.replies.append(text)
+
+
+class LinkedChannelNameTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.linked_info = dict(anti_fake_users.DEFAULT_LINKED_INFO)
+        self.bot = FakeBot()
+        self.middleware = anti_fake_channel.AntiFakeChannelUsersMiddleware()
+        anti_fake_channel._protected_names.clear()
+        anti_fake_channel._reported_names.clear()
+        anti_fake_channel._get_admins.clear()
+
+        async def get_whitelist_snapshot(chat_id):
+            return ChannelWhiteListSnapshot(frozenset(), False, dict(self.linked_info))
+
+        async def update_linked_channel_info(chat_id, linked_id, fullname, username, raw_fullname=None):
+            self.linked_info = {"id": linked_id, "fullname": fullname, "username": username, "raw_fullname": raw_fullname}
+
+        patcher = mock.patch.multiple(anti_fake_users, get_whitelist_snapshot=get_whitelist_snapshot,
+                                      update_linked_channel_info=update_linked_channel_info)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def send(self, message):
+        async def handler(event, data):
+            return None
+        await self.middleware(handler, message, {})
+        return message
+
+    async def link_channel(self):
+        channel = SimpleNamespace(id=CHANNEL_ID, full_name=CHANNEL_NAME, username='news')
+        await self.send(FakeMessage(self.bot, user_id=777000, full_name='Telegram', sender_chat=channel,
+                                    is_automatic_forward=True))
+
+    async def test_raw_channel_name_is_stored(self):
+        await self.link_channel()
+        self.assertEqual(self.linked_info['raw_fullname'], CHANNEL_NAME)
+        self.assertEqual(self.linked_info['fullname'], anti_fake_channel.normalize_channel_names(CHANNEL_NAME))
+
+    async def test_homoglyph_spoof_of_cyrillic_channel_is_banned(self):
+        await self.link_channel()
+        # 第一个字母是拉丁字母 H
+        message = await self.send(FakeMessage(self.bot, user_id=42, full_name='Hовости Канал'))
+        self.assertEqual(self.bot.banned, [42])
+        self.assertTrue(message.deleted)
+
+    async def test_unrelated_cyrillic_name_is_ignored(self):
+        await self.link_channel()
+        message = await self.send(FakeMessage(self.bot, user_id=42, full_name='Новый Канал'))
+        self.assertEqual(self.bot.banned, [])
+        self.assertEqual(message.replies, [])
+
+    async def test_name_stored_before_raw_name_still_matches(self):
+        self.linked_info = {"id": CHANNEL_ID, "fullname": 'News Channel', "username": 'news'}
+        await self.send(FakeMessage(self.bot, user_id=42, full_name='Nеws Channel'))
+        self.assertEqual(self.bot.banned, [42])
+
+
+if __name__ == '__main__':
+    unittest.main()
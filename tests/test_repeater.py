@@ -0,0 +1,33 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.repeater import MessageRepeater
+
+
+class LocalRepeaterTest(unittest.TestCase):
+    def test_repeats_once_per_run(self):
+        repeater = MessageRepeater()
+        messages = [1, 1, 1, 2, 1, 1]
+        self.assertEqual([repeater._record(-100, key) for key in messages], [False, True, False, False, False, True])
+
+    def test_full_table_keeps_oldest_chat_that_sends_again(self):
+        repeater = MessageRepeater(max_chats=3)
+        for chat_id in (-1, -2, -3):
+            repeater._record(chat_id, 1)
+        # 最久没有消息的群组 -1 继续它的复读
+        self.assertTrue(repeater._record(-1, 1))
+        self.assertEqual(list(repeater.chats), [-2, -3, -1])
+
+    def test_full_table_evicts_oldest_for_new_chat(self):
+        repeater = MessageRepeater(max_chats=3)
+        for chat_id in (-1, -2, -3, -4):
+            repeater._record(chat_id, 1)
+        self.assertEqual(list(repeater.chats), [-2, -3, -4])
+        self.assertFalse(repeater._record(-1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
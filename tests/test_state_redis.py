@@ -0,0 +1,200 @@
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adapters.state.redis import RedisStateBackend, RedisError, _COMPARE_AND_SET_SCRIPT
+from core.repeater import MessageRepeater
+
+
+class FakeRedisServer:
+    """
+    Redis stand-in speaking RESP over TCP, implementing the commands the
+    backend sends. EVAL only runs the backend's compare-and-set script.
+    """
+
+    def __init__(self):
+        # key -> (值, 过期时间)
+        self.data: dict[str, tuple[str, float | None]] = {}
+        # 读取以 slow: 开头的键时，服务端先等待这么多秒再回复
+        self.slow_reply = 0.2
+        self.connections = 0
+        self._server: asyncio.Server | None = None
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while command := await self._read_command(reader):
+                reply = await self._execute(*command)
+                writer.write(self._encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> list[str] | None:
+        line = await reader.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2].decode())
+        return args
+
+    @staticmethod
+    def _encode(reply) -> bytes:
+        if isinstance(reply, Exception):
+            return f"-ERR {reply}\r\n".encode()
+        if reply is None:
+            return b"$-1\r\n"
+        if reply == 'OK':
+            return b"+OK\r\n"
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        data = reply.encode()
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    def _get(self, key: str) -> str | None:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry[0]
+
+    def _set(self, key: str, value: str, milliseconds: str | None) -> None:
+        self.data[key] = (value, time.monotonic() + int(milliseconds) / 1000 if milliseconds else None)
+
+    async def _execute(self, name: str, *args: str):
+        name = name.upper()
+        if name in ('AUTH', 'SELECT'):
+            return 'OK'
+        if name == 'GET':
+            if args[0].startswith('slow:'):
+                await asyncio.sleep(self.slow_reply)
+            return self._get(args[0])
+        if name == 'SET':
+            key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+            if 'NX' in options and self._get(key) is not None:
+                return None
+            self._set(key, value, args[2 + options.index('PX') + 1] if 'PX' in options else None)
+            return 'OK'
+        if name == 'DEL':
+            return sum(self.data.pop(key, None) is not None for key in args)
+        if name == 'EVAL':
+            if args[0] != _COMPARE_AND_SET_SCRIPT:
+                return Exception("unknown script")
+            key, require_absent, expected, value, milliseconds = args[2:]
+            current = self._get(key)
+            if (current is not None) if require_absent == '1' else current != expected:
+                return 0
+            self._set(key, value, milliseconds)
+            return 1
+        return Exception(f"unknown command '{name}'")
+
+
+class RedisStateBackendTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = FakeRedisServer()
+        self.url = await self.server.start()
+        self.backend = RedisStateBackend(self.url)
+
+    async def asyncTearDown(self):
+        await self.backend.close()
+        await self.server.stop()
+
+    async def test_get_set_delete(self):
+        self.assertIsNone(await self.backend.get('a'))
+        await self.backend.set('a', '1')
+        self.assertEqual(await self.backend.get('a'), '1')
+        await self.backend.delete('a')
+        self.assertIsNone(await self.backend.get('a'))
+
+    async def test_ttl(self):
+        await self.backend.set('a', '1', ttl=0.05)
+        self.assertEqual(await self.backend.get('a'), '1')
+        await asyncio.sleep(0.1)
+        self.assertIsNone(await self.backend.get('a'))
+
+    async def test_set_if_absent(self):
+        self.assertTrue(await self.backend.set_if_absent('a', '1'))
+        self.assertFalse(await self.backend.set_if_absent('a', '2'))
+        self.assertEqual(await self.backend.get('a'), '1')
+
+    async def test_compare_and_set(self):
+        self.assertFalse(await self.backend.compare_and_set('a', '1', '2'))
+        self.assertTrue(await self.backend.compare_and_set('a', None, '1'))
+        self.assertFalse(await self.backend.compare_and_set('a', None, '2'))
+        self.assertFalse(await self.backend.compare_and_set('a', '0', '2'))
+        self.assertTrue(await self.backend.compare_and_set('a', '1', '2', ttl=60))
+        self.assertEqual(await self.backend.get('a'), '2')
+
+    async def test_error_reply_keeps_connection(self):
+        with self.assertRaises(RedisError):
+            await self.backend.execute('NOPE')
+        self.assertEqual(await self.backend.get('a'), None)
+        self.assertEqual(self.server.connections, 1)
+
+    async def test_cancelled_command_drops_connection(self):
+        await self.backend.set('slow:a', 'stale')
+        await self.backend.set('b', 'fresh')
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.backend.get('slow:a'), timeout=0.05)
+        # 被取消的命令的响应不能被当成下一条命令的响应
+        self.assertEqual(await self.backend.get('b'), 'fresh')
+        self.assertEqual(self.server.connections, 2)
+
+
+class SharedRepeaterTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = FakeRedisServer()
+        url = await self.server.start()
+        self.backends = [RedisStateBackend(url), RedisStateBackend(url)]
+
+    async def asyncTearDown(self):
+        for backend in self.backends:
+            await backend.close()
+        await self.server.stop()
+
+    async def test_same_decisions_as_local_state(self):
+        local = MessageRepeater()
+        shared = MessageRepeater(state=self.backends[0])
+        messages = [1, 1, 1, 2, 1, 1, 3, 3, 3, 3, 1, 3, 3]
+        expected = [local._record(-100, key) for key in messages]
+        self.assertEqual([await shared._record_shared(-100, key) for key in messages], expected)
+        self.assertEqual(expected.count(True), 4)
+
+    async def test_expiry(self):
+        shared = MessageRepeater(message_expiry_seconds=0.05, state=self.backends[0])
+        self.assertFalse(await shared._record_shared(-100, 1))
+        await asyncio.sleep(0.1)
+        self.assertFalse(await shared._record_shared(-100, 1))
+        self.assertTrue(await shared._record_shared(-100, 1))
+
+    async def test_concurrent_instances_repeat_once(self):
+        repeaters = [MessageRepeater(state=backend) for backend in self.backends]
+        for chat_id in range(-120, -100):
+            results = await asyncio.gather(*(
+                repeater._record_shared(chat_id, 7) for repeater in repeaters for _ in range(3)
+            ))
+            self.assertEqual(results.count(True), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
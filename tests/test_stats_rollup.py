@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adapters.db.core import init_db, close_db
+from adapters.db.models import ChatActivityBucket, ChatDailyStats
+from adapters.db.stats import apply_stats_batch, rollup_daily_stats, delete_buckets_before, bucket_day
+
+
+class RollupTest(unittest.IsolatedAsyncioTestCase):
+    CHAT_ID = -100
+    USER_ID = 1
+    BUCKET = 6000000
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        await init_db(sqlite_path=os.path.join(self.directory.name, 'db.sqlite3'))
+
+    async def asyncTearDown(self):
+        await close_db()
+        self.directory.cleanup()
+
+    async def flush(self, count: int) -> None:
+        await apply_stats_batch({}, {}, {}, {}, {(self.CHAT_ID, self.USER_ID, self.BUCKET): count})
+
+    async def daily_count(self) -> int:
+        row = await ChatDailyStats.get(chat_id=self.CHAT_ID, user_id=self.USER_ID, day=bucket_day(self.BUCKET))
+        return row.message_count
+
+    async def test_flush_after_rollup_is_rolled_up_again(self):
+        await self.flush(3)
+        self.assertEqual(await rollup_daily_stats(self.BUCKET + 1), 1)
+        self.assertEqual(await self.daily_count(), 3)
+        # 汇总之后才写入同一个桶的消息
+        await self.flush(2)
+        self.assertEqual(await rollup_daily_stats(self.BUCKET + 1), 1)
+        self.assertEqual(await self.daily_count(), 5)
+        # 没有新消息时不会重复汇总
+        self.assertEqual(await rollup_daily_stats(self.BUCKET + 1), 0)
+        self.assertEqual(await self.daily_count(), 5)
+
+    async def test_purge_keeps_buckets_not_rolled_up(self):
+        await self.flush(3)
+        await rollup_daily_stats(self.BUCKET + 1)
+        await self.flush(2)
+        await delete_buckets_before(self.BUCKET + 1)
+        self.assertTrue(await ChatActivityBucket.exists(chat_id=self.CHAT_ID, bucket=self.BUCKET))
+        await rollup_daily_stats(self.BUCKET + 1)
+        await delete_buckets_before(self.BUCKET + 1)
+        self.assertFalse(await ChatActivityBucket.exists(chat_id=self.CHAT_ID, bucket=self.BUCKET))
+        self.assertEqual(await self.daily_count(), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()